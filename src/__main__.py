@@ -11,6 +11,7 @@ import os
 from sys import exit
 from config import Config
 from mangatracker import main
+from mangatracker import print_pending_migrations
 
 # Allow __main__ to run CLI without PySide2 installed
 try:
@@ -56,9 +57,16 @@ if __name__ == "__main__":
                        "--cli",
                        action="store_true",
                        help="Start CLI")
+    group.add_argument("--check-migrations",
+                       action="store_true",
+                       help="List pending database migrations (dry run)")
 
     args = parser.parse_args()
 
+    if args.check_migrations:
+        print_pending_migrations(Config().database_name)
+        exit()
+
     if args.gui:
         start_gui()
     if args.cli:
@@ -4,6 +4,7 @@ Store and retrieve config variables from config.ini
 Copyright 2019 by Nicholas Bishop
 """
 import os
+import tempfile
 import configparser
 
 
@@ -17,7 +18,7 @@ class Singleton():
     def __new__(cls, *args, **kw):
         if not hasattr(cls, '_instance'):
             orig = super(Singleton, cls)
-            cls._instance = orig.__new__(cls, *args, **kw)
+            cls._instance = orig.__new__(cls)
         return cls._instance
 
 
@@ -26,22 +27,44 @@ class Config(Singleton):
     Config(Singleton)
     Container for a configparser object. Will be able retrieve config items
     for MangaTracker.
+
+    Since Config is a Singleton, every Config() call returns the same
+    object; the config file is only parsed again when its modification
+    time or size changes. load_count records how many times the file
+    has been parsed.
     """
+    load_count = 0
+
     def __init__(self, filename="config.ini"):
         """
         __init__(self, filename)
         Create a configparser object and store config values in class variables
-        for later retrieval
+        for later retrieval, unless they are already loaded from an
+        unchanged copy of filename
 
         Arguments:
         filename (String) -- Name of file for loading/saving config info,
         defaults to config.ini
         """
+        if (getattr(self, "filename", None) == filename
+                and self.file_stamp == get_file_stamp(filename)):
+            return
+
+        self.load(filename)
+
+    def load(self, filename):
+        """
+        load(self, filename)
+        Read config values from filename, creating it with default
+        values if it does not exist
+        """
         if not os.path.isfile(filename):
             self.set_default_config(filename)
 
         self.config = configparser.ConfigParser()
         self.config.read(filename)
+        self.file_stamp = get_file_stamp(filename)
+        Config.load_count += 1
 
         self.filename = filename
         self.database_name = self.config.get('config',
@@ -62,6 +85,9 @@ class Config(Singleton):
         self.default_to_gui = self.config.getboolean('config',
                                                      'default_to_gui',
                                                      fallback=True)
+        self.busy_timeout = self.config.getint('config',
+                                               'busy_timeout',
+                                               fallback=5000)
 
     def set_property(self, prop_name, prop_value):
         """
@@ -98,8 +124,11 @@ class Config(Singleton):
                     or isinstance(prop_value, bool)):
                 self.config["config"]["default_to_gui"] = str(prop_value)
                 self.default_to_gui = prop_value
-        with open(self.filename, 'w') as config_ini:
-            self.config.write(config_ini)
+        elif prop_name == "busy_timeout":
+            if isinstance(prop_value, int) and prop_value >= 0:
+                self.config["config"]["busy_timeout"] = str(prop_value)
+                self.busy_timeout = prop_value
+        self.write_config(self.config, self.filename)
 
     def set_default_config(self, filename):
         """
@@ -115,11 +144,11 @@ class Config(Singleton):
                                   'series_per_page': 0,
                                   'compact_list': 0,
                                   'show_empty_series': False,
-                                  'default_to_gui': True}}
+                                  'default_to_gui': True,
+                                  'busy_timeout': 5000}}
 
         config.read_dict(default_cfg)
-        with open(filename, 'w') as config_ini:
-            config.write(config_ini)
+        self.write_config(config, filename)
 
         # Reset class variables for config object as well
         self.config = config
@@ -130,3 +159,46 @@ class Config(Singleton):
         self.compact_list = False
         self.show_empty_series = False
         self.default_to_gui = True
+        self.busy_timeout = 5000
+
+    def write_config(self, config, filename):
+        """
+        write_config(self, config, filename)
+        Atomically replace filename with the contents of config.
+
+        The config is written to a temporary file in the same directory
+        and moved over filename, so a reader never sees a partly
+        written file.
+        """
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, temp_name = tempfile.mkstemp(prefix=".config-", suffix=".tmp",
+                                         dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as config_ini:
+                config.write(config_ini)
+                config_ini.flush()
+                os.fsync(config_ini.fileno())
+            # mkstemp creates files readable only by the owner
+            mode = (os.stat(filename).st_mode if os.path.isfile(filename)
+                    else 0o644)
+            os.chmod(temp_name, mode & 0o777)
+            os.replace(temp_name, filename)
+        except BaseException:
+            os.remove(temp_name)
+            raise
+
+        # Our own write doesn't need to be parsed again
+        self.file_stamp = get_file_stamp(filename)
+
+
+def get_file_stamp(filename):
+    """
+    get_file_stamp(filename)
+    Returns the modification time and size of filename, or None if
+    it does not exist
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
@@ -5,6 +5,38 @@ Copyright 2019 by Nicholas Bishop
 """
 import sqlite3 as lite
 import re
+import time
+import threading
+from contextlib import contextmanager
+from contextlib import nullcontext
+from functools import lru_cache
+
+# Number of prepared statements kept per connection
+STATEMENT_CACHE_SIZE = 256
+
+# Number of rows fetched at a time by stream()
+STREAM_BATCH_SIZE = 64
+
+# Milliseconds a statement waits for another connection's lock before
+# failing with SQLITE_BUSY
+BUSY_TIMEOUT = 5000
+
+# Number of times a statement failing with SQLITE_BUSY is run again,
+# and the delay in seconds before the first retry (doubled each time)
+BUSY_RETRIES = 3
+BUSY_BACKOFF = 0.05
+
+# Most connections a ConnectionPool keeps open for worker threads, and
+# seconds an unused pooled connection is kept before it is closed
+POOL_SIZE = 4
+POOL_IDLE_TIMEOUT = 60
+
+# Number of compiled patterns kept by regexp()
+REGEXP_CACHE_SIZE = 128
+
+# Application-defined SQL functions created on every connection, stored
+# as name: (number of arguments, function); see register_function()
+SQL_FUNCTIONS = {}
 
 
 # TODO: Create an author table and a publisher table
@@ -13,30 +45,534 @@ class DatabaseManager():
     DatabaseManager(object)
     Main interface between program and SQLite3 database
     """
-    def __init__(self, database_name, init_database, new_db_needed=True):
+    def __init__(self, database_name, init_database, new_db_needed=True,
+                 busy_timeout=BUSY_TIMEOUT, check_same_thread=True,
+                 use_wal=True):
         """
-        __init__(self, database_name, init_database, boolean)
+        __init__(self, database_name, init_database, boolean, busy_timeout,
+                 check_same_thread, use_wal)
         Set up a manager for the database, loading from a file or
         creating a new database if one does not exist. Once
         database is created, the program calls a specialized
         function to initialize the database, if present.
+
+        busy_timeout is how many milliseconds a statement waits for a
+        lock held by another connection (ex. the GUI and CLI open at
+        the same time) before giving up.
+
+        The connection may only be used by the thread which opened it
+        unless check_same_thread is False; other threads should use
+        worker() instead.
+
+        If use_wal is False, the journal mode of the file is left as it
+        is (see open()), ex. to inspect a database without changing it.
+        """
+        self.database_name = None
+        self.con = None
+        self.cur = None
+        self.transaction_depth = 0
+        self.busy_timeout = busy_timeout
+        self.check_same_thread = check_same_thread
+        self.use_wal = use_wal
+        self.thread_id = None
+        self.functions = {}
+        self.pool = None
+        # Worker threads may ask for the pool at the same time
+        self.pool_lock = threading.Lock()
+        self.open(database_name, init_database, new_db_needed)
+
+    def open(self, database_name, init_database=None, new_db_needed=True):
         """
-        self.con = lite.connect(database_name)
-        self.con.create_function("REGEXP", 2, regexp)
+        open(self, database_name, init_database, boolean)
+        Connect to database_name, closing any connection currently
+        held by the manager, then run init_database if present.
+
+        File databases are switched to write-ahead logging unless
+        use_wal is False, so readers see the last committed data
+        without waiting for a writer and a writer is never blocked by
+        readers; only writers wait for each other, for up to
+        busy_timeout milliseconds.
+        """
+        self.close()
+        # Autocommit mode: statements outside transaction() commit on
+        # their own, and transaction() issues BEGIN/COMMIT explicitly
+        self.con = lite.connect(database_name, isolation_level=None,
+                                timeout=self.busy_timeout / 1000,
+                                cached_statements=STATEMENT_CACHE_SIZE,
+                                check_same_thread=self.check_same_thread)
+        self.create_functions()
         self.cur = self.con.cursor()
+        self.thread_id = threading.get_ident()
+        self.database_name = database_name
+
+        if self.use_wal and database_name != ":memory:":
+            # WAL mode is stored in the file, so this is a no-op after
+            # the first time. synchronous stays at its default (FULL),
+            # so a commit survives a power loss.
+            self.retry_busy(self.con.execute, "PRAGMA journal_mode = WAL")
 
         if init_database is not None:
             init_database(self, new_db_needed)
 
-    def query(self, arg):
-        """Runs a query on the database and returns the result"""
-        self.cur.execute(arg)
-        self.con.commit()
+    def create_functions(self):
+        """
+        create_functions(self)
+        Create every function in SQL_FUNCTIONS which is missing from (or
+        was registered again since it was added to) the connection
+        """
+        for name, entry in SQL_FUNCTIONS.items():
+            if self.functions.get(name) is not entry:
+                num_params, func = entry
+                self.con.create_function(name, num_params, func,
+                                         deterministic=True)
+                self.functions[name] = entry
+
+    def worker(self):
+        """
+        worker(self)
+        Returns a context manager giving the calling thread a
+        DatabaseManager for the same database:
+
+            with data_mgr.worker() as worker_mgr:
+                worker_mgr.execute(...)
+
+        The thread which opened this manager gets the manager itself.
+        Any other thread gets a connection from the manager's
+        ConnectionPool, which is returned to the pool afterwards.
+        """
+        if threading.get_ident() == self.thread_id:
+            return nullcontext(self)
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = ConnectionPool(self.database_name,
+                                           self.busy_timeout)
+            pool = self.pool
+        return pool.connection()
+
+    def close_pool(self):
+        """
+        close_pool(self)
+        Close the worker connection pool, if any; worker() creates a
+        new one the next time it is called
+        """
+        with self.pool_lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.close()
+
+    def set_busy_timeout(self, busy_timeout):
+        """
+        set_busy_timeout(self, busy_timeout)
+        Change how many milliseconds statements wait for another
+        connection's lock, including on the open connection
+        """
+        self.busy_timeout = busy_timeout
+        if self.con is not None:
+            self.con.execute("PRAGMA busy_timeout = %d" % busy_timeout)
+        self.close_pool()
+
+    def retry_busy(self, func, *args):
+        """
+        retry_busy(self, func, *args)
+        Returns func(*args), calling it again after a short, doubling
+        delay if it fails because the database is locked by another
+        connection, up to BUSY_RETRIES times.
+
+        Only statements which had no effect when they failed may be
+        retried: a statement outside of a transaction, or one which
+        begins or commits a transaction.
+        """
+        delay = BUSY_BACKOFF
+        for _ in range(BUSY_RETRIES):
+            try:
+                return func(*args)
+            except lite.OperationalError as err:
+                if not is_busy_error(err):
+                    raise
+            time.sleep(delay)
+            delay *= 2
+        return func(*args)
+
+    def reopen(self, database_name=None, init_database=None,
+               new_db_needed=False):
+        """
+        reopen(self, database_name, init_database, boolean)
+        Close the current connection and connect again, either to the
+        same database or to database_name if given.
+        """
+        if database_name is None:
+            database_name = self.database_name
+        self.open(database_name, init_database, new_db_needed)
+
+    def close(self):
+        """
+        close(self)
+        Close connection to database, and every pooled worker connection
+        once it is no longer in use; safe to call more than once
+        """
+        self.close_pool()
+        if self.con is not None:
+            self.con.close()
+        self.con = None
+        self.cur = None
+        self.transaction_depth = 0
+        self.functions = {}
+
+    def is_open(self):
+        """Returns whether the manager holds an open connection"""
+        return self.con is not None
+
+    def execute(self, sql, params=()):
+        """
+        execute(self, sql, params)
+        Runs a query on the database with bound parameters and returns
+        the result. Values must be passed through params rather than
+        formatted into sql, so that each distinct statement text is
+        prepared once and reused from the connection's statement cache.
+
+        Reads never commit. Outside of transaction(), a write is
+        committed as soon as it runs; inside one, it is committed
+        together with the rest of the transaction.
+
+        A statement outside of a transaction which fails because
+        another connection is writing is retried (see retry_busy()).
+        """
+        if self.transaction_depth:
+            self.cur.execute(sql, params)
+        else:
+            self.retry_busy(self.cur.execute, sql, params)
         return self.cur
 
+    def stream(self, sql, params=(), batch_size=STREAM_BATCH_SIZE):
+        """
+        stream(self, sql, params, batch_size)
+        Generator running a query on its own cursor and yielding each
+        row, fetched batch_size rows at a time. Unlike execute(), other
+        queries (including other streams) can run while a stream is
+        being read, and at most one batch of rows is held in memory.
+        """
+        cur = self.con.cursor()
+        cur.arraysize = batch_size
+        try:
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany()
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cur.close()
+
+    def executemany(self, sql, seq_of_params):
+        """
+        executemany(self, sql, seq_of_params)
+        Runs sql once for each set of parameters in seq_of_params,
+        reusing a single prepared statement. Every statement runs in
+        one transaction (a savepoint inside an open transaction), so a
+        failing statement leaves none of the batch written.
+        """
+        with self.transaction():
+            self.cur.executemany(sql, seq_of_params)
+        return self.cur
+
+    @contextmanager
+    def transaction(self):
+        """
+        transaction(self)
+        Context manager grouping every statement in its body into a
+        single transaction, committed on exit or rolled back if the
+        body raises. Nested calls become savepoints inside the
+        outermost transaction, so functions which open their own
+        transaction can be batched into one commit:
+
+            with data_mgr.transaction():
+                for series in series_list:
+                    series.add_series_to_database(data_mgr)
+
+        The write lock is taken when the transaction begins (BEGIN
+        IMMEDIATE), so a transaction never fails partway through
+        because another connection started writing first.
+        """
+        savepoint = "txn_%d" % self.transaction_depth
+        if self.transaction_depth == 0:
+            self.retry_busy(self.con.execute, "BEGIN IMMEDIATE")
+        else:
+            self.con.execute("SAVEPOINT %s" % savepoint)
+        self.transaction_depth += 1
+
+        try:
+            yield self
+        except BaseException:
+            self.transaction_depth -= 1
+            if self.transaction_depth == 0:
+                self.con.execute("ROLLBACK")
+            else:
+                self.con.execute("ROLLBACK TO %s" % savepoint)
+                self.con.execute("RELEASE %s" % savepoint)
+            raise
+
+        self.transaction_depth -= 1
+        if self.transaction_depth == 0:
+            self.retry_busy(self.con.execute, "COMMIT")
+        else:
+            self.con.execute("RELEASE %s" % savepoint)
+
+    def in_transaction(self):
+        """Returns whether a transaction() block is currently open"""
+        return self.transaction_depth > 0
+
+    def has_table(self, name):
+        """Returns whether a table (or virtual table) named name exists"""
+        return self.execute("SELECT 1 FROM sqlite_master WHERE "
+                            "type = 'table' AND name = ?",
+                            (name,)).fetchone() is not None
+
+    def user_version(self):
+        """Returns the schema version stored in PRAGMA user_version"""
+        return self.execute("PRAGMA user_version").fetchone()[0]
+
+    def backup(self, filename):
+        """
+        backup(self, filename)
+        Copy the whole database to filename using SQLite's online
+        backup, which is consistent even while the database is in use
+        """
+        target = lite.connect(filename)
+        try:
+            self.con.backup(target)
+        finally:
+            target.close()
+
+    def migrate(self, migrations, dry_run=False, backup=True):
+        """
+        migrate(self, migrations, boolean, boolean)
+        Bring the database schema up to date and return the list of
+        migrations applied.
+
+        migrations is a list of (version, description, function) tuples
+        in ascending order of version. Every migration newer than
+        PRAGMA user_version is applied in its own transaction together
+        with the user_version update, so a failed migration leaves the
+        database at the last good version.
+
+        If backup is True, the database is first copied to
+        <database_name>.v<current version>.bak. If dry_run is True, the
+        pending migrations are run and then rolled back, without a
+        backup, checking that they succeed without changing anything.
+        """
+        current_version = self.user_version()
+        pending = [mig for mig in migrations if mig[0] > current_version]
+        if not pending:
+            return pending
+
+        if dry_run:
+            try:
+                with self.transaction():
+                    for version, description, func in pending:
+                        func(self)
+                    raise DryRunRollback()
+            except DryRunRollback:
+                pass
+            return pending
+
+        if backup and self.database_name != ":memory:":
+            self.backup("%s.v%d.bak" % (self.database_name,
+                                        current_version))
+
+        for version, description, func in pending:
+            with self.transaction():
+                func(self)
+                self.execute("PRAGMA user_version = %d" % version)
+        return pending
+
     def __del__(self):
         """Close connection to database when object goes out of scope"""
-        self.con.close()
+        self.close()
+
+
+class ConnectionPool():
+    """
+    ConnectionPool(object)
+
+    Bounded pool of DatabaseManagers connected to one database, for
+    worker threads. A thread borrows a manager with connection() and
+    has it to itself until the block ends; nested connection() calls
+    in the same thread get the same manager. At most max_size managers
+    are open at once (further threads wait for one to be returned).
+
+    Cleanup is lazy: managers left unused for idle_timeout seconds are
+    closed the next time the pool is used (checkout(), checkin() or
+    prune()), not by a timer, so an idle pool keeps its connections
+    until then or until close().
+    """
+    def __init__(self, database_name, busy_timeout=BUSY_TIMEOUT,
+                 max_size=POOL_SIZE, idle_timeout=POOL_IDLE_TIMEOUT):
+        """
+        __init__(self, database_name, busy_timeout, max_size, idle_timeout)
+        Create an empty pool; connections are opened when first needed
+        """
+        if database_name == ":memory:":
+            raise ValueError("an in-memory database can't be shared "
+                             "between connections")
+        self.database_name = database_name
+        self.busy_timeout = busy_timeout
+        self.idle_timeout = idle_timeout
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.lock = threading.Lock()
+        # (manager, time returned) of unused managers, oldest first
+        self.idle = []
+        self.local = threading.local()
+        self.closed = False
+
+    @contextmanager
+    def connection(self):
+        """
+        connection(self)
+        Context manager lending the calling thread a DatabaseManager
+        """
+        manager = getattr(self.local, "manager", None)
+        if manager is not None:
+            yield manager
+            return
+
+        self.slots.acquire()
+        try:
+            manager = self.checkout()
+            self.local.manager = manager
+            try:
+                yield manager
+            finally:
+                self.local.manager = None
+                self.checkin(manager)
+        finally:
+            self.slots.release()
+
+    def checkout(self):
+        """Returns the most recently used idle manager, or a new one"""
+        with self.lock:
+            if self.closed:
+                raise lite.ProgrammingError("connection pool is closed")
+            self.prune_locked()
+            manager = self.idle.pop()[0] if self.idle else None
+
+        if manager is None:
+            # Pooled managers move between threads, but only ever
+            # belong to one thread at a time
+            manager = DatabaseManager(self.database_name, None,
+                                      busy_timeout=self.busy_timeout,
+                                      check_same_thread=False)
+        else:
+            manager.create_functions()
+        return manager
+
+    def checkin(self, manager):
+        """Returns manager to the pool, or closes it if it can't be reused"""
+        if manager.in_transaction() or not manager.is_open():
+            manager.close()
+            return
+        with self.lock:
+            if self.closed:
+                manager.close()
+                return
+            self.idle.append((manager, time.monotonic()))
+            self.prune_locked()
+
+    def prune(self):
+        """Close every manager which has been idle for idle_timeout"""
+        with self.lock:
+            self.prune_locked()
+
+    def prune_locked(self):
+        """prune(), with self.lock already held"""
+        cutoff = time.monotonic() - self.idle_timeout
+        while self.idle and self.idle[0][1] <= cutoff:
+            self.idle.pop(0)[0].close()
+
+    def idle_count(self):
+        """Returns the number of open managers not lent to a thread"""
+        with self.lock:
+            return len(self.idle)
+
+    def close(self):
+        """
+        close(self)
+        Close every idle manager now and every lent manager when it is
+        returned; the pool can't be used afterwards
+        """
+        with self.lock:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for manager, _ in idle:
+            manager.close()
+
+
+class DryRunRollback(Exception):
+    """Raised to roll back the migrations run by migrate(dry_run=True)"""
+
+
+_shared_manager = None
+
+
+def shared_manager(database_name=None, init_database=None,
+                   new_db_needed=False, busy_timeout=None):
+    """
+    shared_manager(database_name, init_database, boolean, busy_timeout)
+    Returns the process-wide DatabaseManager, connecting on first use.
+
+    If database_name is given and differs from the open database (or
+    the shared connection was closed), the shared manager reconnects
+    to database_name, so callers holding the returned object always
+    talk to the currently configured database. If busy_timeout is
+    given, it replaces the manager's busy timeout.
+    """
+    global _shared_manager
+    if _shared_manager is None:
+        _shared_manager = DatabaseManager(
+            database_name, init_database, new_db_needed,
+            BUSY_TIMEOUT if busy_timeout is None else busy_timeout)
+        return _shared_manager
+
+    if (busy_timeout is not None
+            and busy_timeout != _shared_manager.busy_timeout):
+        _shared_manager.set_busy_timeout(busy_timeout)
+    if database_name is not None and (
+            database_name != _shared_manager.database_name
+            or not _shared_manager.is_open()):
+        _shared_manager.reopen(database_name, init_database, new_db_needed)
+    return _shared_manager
+
+
+def close_shared_manager():
+    """Close the process-wide DatabaseManager's connection, if open"""
+    if _shared_manager is not None:
+        _shared_manager.close()
+
+
+def is_busy_error(err):
+    """
+    is_busy_error(err)
+    Returns whether the sqlite3 error err means the database was locked
+    by another connection (SQLITE_BUSY)
+    """
+    code = getattr(err, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xff == lite.SQLITE_BUSY
+    return str(err).startswith("database is locked")
+
+
+def register_function(name, num_params, func):
+    """
+    register_function(name, num_params, func)
+    Make func available to SQL as name on every connection opened by a
+    DatabaseManager, including the shared connection if already open.
+    Idle pooled connections create it the next time they are lent.
+
+    func must be deterministic (same result for the same arguments),
+    since it may be called from triggers and indexes.
+    """
+    SQL_FUNCTIONS[name] = (num_params, func)
+    if _shared_manager is not None and _shared_manager.is_open():
+        _shared_manager.create_functions()
 
 
 def regexp(pattern, value):
@@ -44,12 +580,32 @@ def regexp(pattern, value):
     regexp()
     Simple regex function to add to SQLite instance
 
+    Compiled patterns are kept in a bounded LRU cache, so filtering
+    every row of a table with the same pattern compiles it only once.
+
     Arguments:
     pattern - regex to filter with
     value   - string to search with regex
     """
-    reg = re.compile(pattern)
-    return reg.search(value) is not None
+    return compile_pattern(pattern).search(value) is not None
+
+
+@lru_cache(maxsize=REGEXP_CACHE_SIZE)
+def compile_pattern(pattern):
+    """Returns pattern compiled, reusing a cached result if present"""
+    return re.compile(pattern)
+
+
+def regexp_cache_info():
+    """
+    regexp_cache_info()
+    Returns the hits, misses, maxsize and currsize counters of the
+    compiled-pattern cache used by regexp()
+    """
+    return compile_pattern.cache_info()
+
+
+register_function("REGEXP", 2, regexp)
 
 
 def is_database(filename):
@@ -7,13 +7,29 @@ Copyright 2019 by Nicholas Bishop
 """
 import os.path
 from databasemanager import DatabaseManager
-from databasemanager import regexp
+from databasemanager import shared_manager
+from databasemanager import close_shared_manager
 from databasemanager import is_database
 from series import Series
 from series import SeriesItems as SI
 from series import input_series
 from series import init_database
+from series import NOT_EMPTY
+from series import COMPACT_COLUMNS
+from series import compact_entry_string
+from seriesquery import compile_search_source
+from seriesquery import SearchSyntaxError
+from migrations import SERIES_MIGRATIONS
+from migrations import MigrationError
 from config import Config
+from paginator import KeysetPaginator
+
+# Columns which series lists may be ordered by
+LIST_ORDERS = ("name", "author", "publisher", "alt_names")
+
+# Search results fetched at a time while choosing a series to edit or
+# remove
+SELECT_PAGE_SIZE = 20
 
 
 def entry_to_series(entry):
@@ -26,7 +42,7 @@ def entry_to_series(entry):
         return None
 
     series = Series(name=str(entry[SI.NAME]),                # Series Name
-                    volumes_owned=str(entry[SI.VOL_OWNED]),  # Volumes Owned
+                    volumes_owned=entry[SI.VOL_OWNED],       # Volumes Owned
                     is_completed=entry[SI.IS_COMPLETED],     # Is Completed
                     next_volume=entry[SI.NEXT_VOLUME],       # Next Volume
                     publisher=str(entry[SI.PUBLISHER]),      # Publisher
@@ -41,77 +57,92 @@ def print_all_series(data_mgr, order="name"):
     print_all_series(data_mgr)
     Print status of all series in database
     """
-    cur = data_mgr.query("SELECT rowid, * FROM Series ORDER BY %s" % (order))
-    entries = cur.fetchall()
-    unknown_entries = []
-    count = 0
-    config = Config()
-
-    for entry in entries:
-        if entry[SI[order.upper()]] == "Unknown":
-            unknown_entries.append(entry)
-            continue
-        if not config.show_empty_series and entry[SI.VOL_OWNED] == "0,0,0,0":
-            continue
-        if (config.series_per_page != 0
-                and count != 0
-                and count % config.series_per_page == 0):
-            print("----------------------------------------")
-            continue_print = input("Press Enter to continue "
-                                   "or type 'q' to stop: ").strip()
-            if continue_print in ('q', 'Q'):
-                return
-
-        print("----------------------------------------")
-        series = entry_to_series(entry)
-        print(series)
-        count += 1
+    # Column names can't be bound as parameters; only allow known columns
+    if order not in LIST_ORDERS:
+        order = "name"
+    columns, format_entry = list_format()
+    # Series with an unknown value are listed last; ties keep insertion
+    # order. Matches the series_*_list indexes, so no sort is needed.
+    print_pages(KeysetPaginator(
+        data_mgr, "Series", (order + "_unknown", order, "rowid"),
+        "" if Config().show_empty_series else NOT_EMPTY,
+        page_size=Config().series_per_page, columns=columns), format_entry)
+
+
+def list_format():
+    """
+    list_format()
+    Returns the columns to select for a list of series, and a function
+    formatting each selected row for printing. Compact lists select
+    only the columns shown instead of building a Series for each row.
+    """
+    if Config().compact_list:
+        return (", ".join(COMPACT_COLUMNS), compact_entry_string)
+    return ("rowid, *", lambda entry: entry_to_series(entry).full_string())
 
-    if unknown_entries:
-        for entry in unknown_entries:
-            if (config.series_per_page != 0
-                    and count != 0
-                    and count % config.series_per_page == 0):
-                print("----------------------------------------")
-                continue_print = input("Press Enter to continue "
-                                       "or type 'q' to stop: ").strip()
-                if continue_print in ('q', 'Q'):
-                    return
 
+def print_pages(paginator, format_entry):
+    """
+    print_pages()
+    Prints the rows from a KeysetPaginator using format_entry, fetching
+    one page at a time. After every page but the last, asks whether to
+    move forward, go back to the previous page or stop; the last page
+    ends the listing without waiting for input.
+    """
+    while True:
+        count = 0
+        for entry in paginator.fetch_page():
             print("----------------------------------------")
-            series = entry_to_series(entry)
-            print(series)
+            print(format_entry(entry))
             count += 1
 
-    if entries:
+        if not paginator.has_next():
+            break
+
         print("----------------------------------------")
+        prompt = "Press Enter to continue"
+        prompt += ", 'b' to go back" if paginator.has_previous() else ""
+        prompt += " or type 'q' to stop: "
+        continue_print = input(prompt).strip()
+        # There is nothing to go back to from the first page
+        while continue_print in ('b', 'B') and not paginator.has_previous():
+            continue_print = input(prompt).strip()
+
+        if continue_print in ('b', 'B'):
+            paginator.previous_page()
+        elif continue_print in ('q', 'Q'):
+            return
+        else:
+            paginator.next_page()
 
+    if count:
+        print("----------------------------------------")
 
-def print_entries_list(entries):
-    """
-    print_entries_list()
-    Function to print all items matching database query
-    """
-    count = 0
-    config = Config()
 
-    for entry in entries:
-        if (config.series_per_page != 0
-                and count != 0
-                and count % config.series_per_page == 0):
-            print("----------------------------------------")
-            continue_print = input("Press Enter to continue "
-                                   "or type 'q' to stop: ").strip()
-            if continue_print in ('q', 'Q'):
-                return
+def print_matching_series(data_mgr, condition, params, description):
+    """
+    print_matching_series()
+    Prints how many series match an SQL condition, followed by the
+    matching series in order of name
 
-        print("----------------------------------------")
-        series = entry_to_series(entry)
-        print(series)
-        count += 1
+    Arguments:
+    data_mgr - DatabaseManager object with active connection to database
+    condition - SQL condition on Series columns, with ? placeholders
+    params - values bound to the placeholders in condition
+    description - plural description of the series (ex. "completed series")
+    """
+    count = data_mgr.execute("SELECT COUNT(*) FROM Series WHERE %s"
+                             % condition, params).fetchone()[0]
+    if not count:
+        print("No {0} found.".format(description))
+        return
 
-    if entries:
-        print("----------------------------------------")
+    print("Found {0} {1}:".format(count, description))
+    columns, format_entry = list_format()
+    print_pages(KeysetPaginator(data_mgr, "Series", ("name", "rowid"),
+                                condition, params,
+                                page_size=Config().series_per_page,
+                                columns=columns), format_entry)
 
 
 def list_series(data_mgr):
@@ -122,47 +153,22 @@ def list_series(data_mgr):
     """
     selection = input("[L]ist All / by [O]ther Field / [C]omplete / "
                       "[I]ncomplete / with [G]aps / [W]ishlist: ").strip()
-    config = Config()
+    empty_filter = "" if Config().show_empty_series else " AND " + NOT_EMPTY
 
     # Completed Series
     if selection in ('c', 'C'):
-        cur = data_mgr.query("SELECT rowid, * FROM Series WHERE "
-                             "is_completed = 1 ORDER BY name")
-        entries = cur.fetchall()
-
-        if not entries:
-            print("No completed series found.")
-            return
-
-        if not config.show_empty_series:
-            for entry in entries:
-                if entry[SI["VOL_OWNED"]] == "0,0,0,0":
-                    entries.remove(entry)
-
-        print("Found {0} completed series:".format(len(entries)))
-        print_entries_list(entries)
+        print_matching_series(data_mgr, "is_completed = ?" + empty_filter,
+                              (1,), "completed series")
 
     # Incomplete Series
     elif selection in ('i', 'I'):
-        cur = data_mgr.query("SELECT rowid, * FROM Series WHERE "
-                             "is_completed = 0 ORDER BY name")
-        entries = cur.fetchall()
-
-        if not entries:
-            print("No incomplete series found.")
-            return
-
-        if not config.show_empty_series:
-            for entry in entries:
-                if entry[SI["VOL_OWNED"]] == "0,0,0,0":
-                    entries.remove(entry)
-
-        print("Found {0} incomplete series:".format(len(entries)))
-        print_entries_list(entries)
+        print_matching_series(data_mgr, "is_completed = ?" + empty_filter,
+                              (0,), "incomplete series")
 
     # Series with Gaps
     elif selection in ('g', 'G'):
-        list_series_with_gaps(data_mgr, config)
+        print_matching_series(data_mgr, "has_gaps = ?", (1,),
+                              "series with gaps")
 
     # Order by another field
     elif selection in ('o', 'O'):
@@ -183,16 +189,8 @@ def list_series(data_mgr):
 
     # View Wishlist (all empty series)
     elif selection in ('w', 'W'):
-        cur = data_mgr.query("SELECT rowid, * FROM Series WHERE "
-                             "volumes_owned = '0,0,0,0'")
-        entries = cur.fetchall()
-
-        if not entries:
-            print("No wishlisted series found.")
-            return
-
-        print("Found {0} wishlisted series:".format(len(entries)))
-        print_entries_list(entries)
+        print_matching_series(data_mgr, "is_empty = ?", (1,),
+                              "wishlisted series")
 
     # Default (print all)
     else:
@@ -217,69 +215,38 @@ def list_series_by_field(data_mgr):
         print_all_series(data_mgr, "name")
 
 
-def list_series_with_gaps(data_mgr, config):
+def search_for_series(data_mgr, page_size):
     """
-    list_series_with_gaps()
-    Retrieves and prints the list of all series in the database
-    for which there is a gap (the set of all volumes is not continuous)
-
-    Arguments:
-    data_mgr - DatabaseManager object with active connection to database
-    config - Config object with current config settings loaded.
+    search_for_series()
+    Takes a DatabaseManager object, queries the database for a
+    search term given by user, and returns a KeysetPaginator over
+    the matching entries with page_size entries per page, the number
+    of matching entries and the search term
     """
-    cur = data_mgr.query("SELECT rowid, * FROM Series ORDER BY name")
-    entries = cur.fetchall()
-    series_list = [entry_to_series(entry) for entry in entries]
-    series_with_gaps = []
-
-    for series in series_list:
-        binary_str = series.get_volumes_owned_binary()
-        if regexp("1*0+1", binary_str):
-            series_with_gaps.append(series)
-
-    if not series_with_gaps:
-        print("No series with gaps found.")
-        return
-
-    print("Found {0} series with gaps:".format(
-        len(series_with_gaps)))
-
-    count = 0
-    for series in series_with_gaps:
-        if (config.series_per_page != 0
-                and count != 0
-                and count % config.series_per_page == 0):
-            print("----------------------------------------")
-            continue_print = input("Press Enter to continue "
-                                   "or type 'q' to stop: ").strip()
-            if continue_print in ('q', 'Q'):
-                return
-
-        print("----------------------------------------")
-        print(series)
-        count += 1
-
-    if series_with_gaps:
-        print("----------------------------------------")
+    search_term = input("Search for series by name or other field: ")
+    try:
+        paginator = find_series(data_mgr, search_term, page_size)
+    except SearchSyntaxError as error:
+        print(error)
+        return (None, 0, search_term)
+    return (paginator, paginator.count(), search_term)
 
 
-def search_for_series(data_mgr):
+def find_series(data_mgr, search_term, page_size=0):
     """
-    search_for_series()
-    Takes a DatabaseManager object, queries the database for a
-    search term given by user, returns the search term and
-    any matching entries
+    find_series()
+    Returns a KeysetPaginator over the series matching search_term, a
+    structured query such as 'author:oda completed:no' (see
+    seriesquery.py), with page_size series per page (0 for one page).
+    Plain words match as a phrase in any text field, with the last
+    word matching as a prefix (ex. 'author 1' or 'alternate ti'). Uses
+    the Series_fts full-text index, best matches first, if it exists.
     """
-    search_term = input("Search for series by name or other field: ")
-    cur = data_mgr.query("SELECT rowid, * FROM Series WHERE "
-                         "name LIKE '%{0}%' OR "
-                         "publisher LIKE '%{0}%' OR "
-                         "author LIKE '%{0}%' OR "
-                         "alt_names LIKE '%{0}%'"
-                         "ORDER BY name"
-                         .format(search_term))
-    entries = cur.fetchall()
-    return (entries, search_term)
+    table, condition, params, sort_keys = compile_search_source(
+        search_term, data_mgr.has_table("Series_fts"))
+    return KeysetPaginator(data_mgr, table, sort_keys, condition, params,
+                           page_size=page_size,
+                           columns="Series.rowid, Series.*")
 
 
 def remove_series_from_database(data_mgr, series):
@@ -288,8 +255,9 @@ def remove_series_from_database(data_mgr, series):
     Takes a DatabaseManager object and a Series object, and removes
     the associated series from the database
     """
-    data_mgr.query("DELETE FROM Series WHERE "
-                   "rowid = %d" % series.rowid)
+    with data_mgr.transaction():
+        data_mgr.execute("DELETE FROM Series WHERE "
+                         "rowid = ?", (series.rowid,))
     print("Series '%s' removed from database." % (series.name))
 
 
@@ -299,7 +267,13 @@ def main():
     Main driver function for mangatracker program
     """
     config = Config()
-    data_mgr = DatabaseManager(config.database_name, init_database)
+    try:
+        data_mgr = shared_manager(config.database_name, init_database, True,
+                                  config.busy_timeout)
+    except MigrationError as error:
+        print(error)
+        close_shared_manager()
+        return
 
     print_all_series(data_mgr)
 
@@ -317,17 +291,19 @@ def main():
 
         if user_input in ('s', 'S'):
             # TODO: color matching text (maybe not?)
-            entries, search_term = search_for_series(data_mgr)
+            paginator, count, search_term = search_for_series(
+                data_mgr, config.series_per_page)
 
             print()
-            if not entries:
+            if not count:
                 print("No series found for '{0}'."
                       .format(search_term))
                 continue
 
             print("Found {0} entries for '{1}':"
-                  .format(len(entries), search_term))
-            print_entries_list(entries)
+                  .format(count, search_term))
+            print_pages(paginator,
+                        lambda entry: str(entry_to_series(entry)))
             continue
 
         if user_input in ('l', 'L'):
@@ -342,10 +318,12 @@ def main():
                 new_series = None
 
             if new_series is not None:
-                new_series.add_series_to_database(data_mgr)
-                print("----------------------------------------")
-                print(new_series)
-                print("----------------------------------------")
+                if new_series.add_series_to_database(data_mgr):
+                    print("----------------------------------------")
+                    print(new_series)
+                    print("----------------------------------------")
+                else:
+                    print("Failed to add series! (name conflict)")
 
             continue
 
@@ -362,9 +340,66 @@ def main():
             options_menu(config)
 
             # Reset database connection if name changed or database deleted
-            data_mgr = DatabaseManager(config.database_name,
-                                       init_database,
-                                       False)
+            try:
+                data_mgr = shared_manager(config.database_name,
+                                          init_database,
+                                          False,
+                                          config.busy_timeout)
+            except MigrationError as error:
+                print(error)
+                break
+
+    # Closing the last connection checkpoints and removes the WAL file
+    close_shared_manager()
+
+
+def print_pending_migrations(database_name):
+    """
+    print_pending_migrations()
+    Lists the schema migrations which would be applied to the database
+    the next time it is opened. The migrations are run and rolled back
+    (a dry run), so any migration which would fail raises here without
+    the database being changed.
+
+    Arguments:
+    database_name - Filename of database to check
+    """
+    if not os.path.isfile(database_name):
+        print("Database %s does not exist." % database_name)
+        return
+
+    # Checking must not switch the file to WAL mode
+    data_mgr = DatabaseManager(database_name, None,
+                               busy_timeout=Config().busy_timeout,
+                               use_wal=False)
+    cur = data_mgr.execute("SELECT name FROM sqlite_master "
+                           "WHERE type = 'table' AND name = 'Series'")
+    if cur.fetchone() is None:
+        print("Database %s has no series table; it will be "
+              "created when the database is opened." % database_name)
+        data_mgr.close()
+        return
+
+    current_version = data_mgr.user_version()
+    try:
+        pending = data_mgr.migrate(SERIES_MIGRATIONS, dry_run=True)
+    except MigrationError as error:
+        print("Database %s is at version %d; a pending migration "
+              "can't be applied yet:" % (database_name, current_version))
+        print(error)
+        return
+    finally:
+        data_mgr.close()
+
+    if not pending:
+        print("Database %s is up to date (version %d)."
+              % (database_name, current_version))
+        return
+
+    print("Database %s is at version %d; pending migrations:"
+          % (database_name, current_version))
+    for version, description, func in pending:
+        print("  %d. %s" % (version, description))
 
 
 def edit_series(data_mgr):
@@ -377,19 +412,20 @@ def edit_series(data_mgr):
     Arguments:
     data_mgr - DatabaseManager object connected to active database
     """
-    entries, search_term = search_for_series(data_mgr)
+    paginator, total, search_term = search_for_series(data_mgr,
+                                                      SELECT_PAGE_SIZE)
     count = 0
 
     print()
-    if not entries:
+    if not total:
         print("No series found for '{0}'."
               .format(search_term))
         return
 
     print("Found {0} entries for '{1}':"
-          .format(len(entries), search_term))
+          .format(total, search_term))
 
-    for entry in entries:
+    for entry in paginator.rows():
         print("----------------------------------------")
         series = entry_to_series(entry)
         print(series)
@@ -408,7 +444,7 @@ def edit_series(data_mgr):
             break
 
         count += 1
-        if count != len(entries):
+        if count != total:
             print("Next Series:")
 
 
@@ -420,19 +456,20 @@ def remove_series(data_mgr):
     Arguments:
     data_mgr - DatabaseManager object connected to current database
     """
-    entries, search_term = search_for_series(data_mgr)
+    paginator, total, search_term = search_for_series(data_mgr,
+                                                      SELECT_PAGE_SIZE)
     count = 0
 
     print()
-    if not entries:
+    if not total:
         print("No series found for '{0}'."
               .format(search_term))
         return
 
     print("Found {0} entries for '{1}':"
-          .format(len(entries), search_term))
+          .format(total, search_term))
 
-    for entry in entries:
+    for entry in paginator.rows():
         print("----------------------------------------")
         series = entry_to_series(entry)
         print(series)
@@ -449,7 +486,7 @@ def remove_series(data_mgr):
             break
 
         count += 1
-        if count != len(entries):
+        if count != total:
             print("Next Series:")
 
 
@@ -499,10 +536,9 @@ def options_menu(config):
 
         # 2. Change volume limit
         elif option == 2:
-            new_vol_limit = input("Enter new volume limit"
-                                  "(Must be multiple of 32): ")
+            new_vol_limit = input("Enter new volume limit: ")
             new_vol_limit = int(new_vol_limit)
-            if new_vol_limit % 32 == 0 and new_vol_limit >= 32:
+            if new_vol_limit >= 1:
                 config.set_property("volume_limit", new_vol_limit)
                 print("Volume limit changed to %d." % new_vol_limit)
             else:
@@ -579,10 +615,12 @@ def options_menu(config):
                                     "(will copy to {0}.bak) (y/N): "
                                     .format(config.database_name)).strip()
             if delete_database in ('y', 'Y'):
+                # Release the shared connection before moving the file;
+                # main() reconnects and initializes the new database
+                shared_manager().close()
                 os.rename(config.database_name,
                           config.database_name+".bak")
                 print("Database deleted; initializing new database...")
-                DatabaseManager(False, init_database)
             print("Database not changed.")
 
         else:
@@ -1,25 +1,284 @@
 #!/usr/bin/env python3
 import sys
-from PySide2.QtCore import Qt
+import threading
+from collections import OrderedDict
+import sqlite3 as lite
+from PySide2.QtCore import Qt, QObject, QRunnable, QThreadPool, Signal
+from PySide2.QtCore import QAbstractListModel, QSortFilterProxyModel
+from PySide2.QtCore import QModelIndex, QTimer
 from PySide2.QtWidgets import QApplication, QMainWindow
 from PySide2.QtWidgets import QButtonGroup, QMenu, QActionGroup
 from PySide2.QtWidgets import QAbstractItemView, QHeaderView
-from PySide2.QtWidgets import QTableWidgetItem, QListWidgetItem
+from PySide2.QtWidgets import QTableWidgetItem
 from PySide2.QtWidgets import QDialog, QMessageBox, QComboBox
 from ui import ui_mainwindow
 from ui import ui_editseries
 from ui import ui_addseries
 from ui import ui_configdialog
-from databasemanager import DatabaseManager
+from databasemanager import shared_manager
+from databasemanager import close_shared_manager
 from databasemanager import regexp
 from databasemanager import is_database
 from series import Series
-from series import SeriesItems as SI
 from series import init_database
+from series import LIST_COLUMNS
+from series import ListItems as LI
+from series import compact_entry_string
+from series import list_entry_to_series
+from seriesquery import compile_filter
+from seriesquery import index_words
+from seriesquery import SearchSyntaxError
 from series import generate_volumes_owned
+from series import parse_volumes
+from series import name_in_use
+from series import WriteResult
 from config import Config
 from mangatracker import entry_to_series
 from mangatracker import remove_series_from_database
+from migrations import MigrationError
+
+# Number of rows a ListLoader sends to the main window at a time
+LOAD_BATCH_SIZE = 256
+
+# Milliseconds after the last key typed in the filter bar before the
+# list is refiltered
+FILTER_DELAY = 250
+
+# Number of Series kept by a SeriesListModel once built, and number of
+# rows either side of the selected series built before they are needed
+SERIES_CACHE_SIZE = 64
+PREFETCH_ROWS = 2
+
+
+class ListLoaderSignals(QObject):
+    """
+    ListLoaderSignals(QObject)
+    Signals sent by a ListLoader. Every signal carries the generation
+    of its load, so results of a superseded load can be ignored.
+    rows_loaded also carries the index_words() of each row.
+    """
+    rows_loaded = Signal(int, object, object)
+    finished = Signal(int)
+    failed = Signal(int, str)
+
+
+class ListLoader(QRunnable):
+    """
+    ListLoader(QRunnable)
+    Selects columns from every series on a QThreadPool thread, using a
+    pooled connection from data_mgr.worker(), and sends the rows to the
+    main window in batches of batch_size through its signals. The words
+    searched by the filter bar are folded on the worker thread too. A
+    cancelled loader stops at the next row and sends nothing more.
+    """
+    def __init__(self, generation, data_mgr, columns,
+                 batch_size=LOAD_BATCH_SIZE):
+        super(ListLoader, self).__init__()
+        # Signals are kept by the main window, not deleted with the
+        # runnable when it finishes
+        self.setAutoDelete(False)
+        self.signals = ListLoaderSignals()
+        self.generation = generation
+        self.data_mgr = data_mgr
+        self.columns = columns
+        self.batch_size = batch_size
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """Stop loading; safe to call from any thread"""
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            with self.data_mgr.worker() as worker_mgr:
+                batch = []
+                words = []
+                for entry in worker_mgr.stream(
+                        "SELECT %s FROM Series" % ", ".join(self.columns),
+                        batch_size=self.batch_size):
+                    if self.cancelled.is_set():
+                        break
+                    batch.append(entry)
+                    words.append(index_words(entry, self.columns))
+                    if len(batch) == self.batch_size:
+                        self.signals.rows_loaded.emit(self.generation, batch,
+                                                      words)
+                        batch = []
+                        words = []
+            if not self.cancelled.is_set():
+                if batch:
+                    self.signals.rows_loaded.emit(self.generation, batch,
+                                                  words)
+                self.signals.finished.emit(self.generation)
+        except lite.Error as error:
+            self.signals.failed.emit(self.generation, str(error))
+
+
+class SeriesListModel(QAbstractListModel):
+    """
+    SeriesListModel(QAbstractListModel)
+    List model holding one row of LIST_COLUMNS per series. The text of
+    a row is only formatted when a view asks for it, so only the rows
+    on screen are ever turned into strings.
+
+    Each row is kept with its index_words(), so filtering the rows
+    again never folds their text again.
+
+    Rows hold every column shown for a series, so the model also acts
+    as a cache of the series table: series() builds a Series from its
+    row without querying the database, keeping the most recently used
+    until their row changes.
+    """
+    def __init__(self, parent=None):
+        super(SeriesListModel, self).__init__(parent)
+        self.entries = []
+        # index_words() of each row in entries
+        self.words = []
+        # rowid of each series: its row in entries
+        self.rows = {}
+        # rowid: Series, least recently used first
+        self.series_cache = OrderedDict()
+        # rowids removed since the model was cleared; a list load still
+        # running may have read them before they were removed
+        self.removed = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = self.entries[index.row()]
+        if role == Qt.DisplayRole:
+            return compact_entry_string(entry)
+        if role == Qt.UserRole:
+            return entry[LI.ROWID]
+        return None
+
+    def clear(self):
+        """Removes every row"""
+        self.beginResetModel()
+        self.entries = []
+        self.words = []
+        self.rows = {}
+        self.series_cache.clear()
+        self.removed = set()
+        self.endResetModel()
+
+    def add_entries(self, entries, words=None):
+        """Appends rows of LIST_COLUMNS and their index_words() (found
+        here if not given) to the model, skipping any series already
+        present (ex. added while the list was loading) or removed since
+        the model was cleared (ex. deleted while the list was loading)"""
+        if words is None:
+            words = [index_words(entry, LIST_COLUMNS) for entry in entries]
+        new_rows = [(entry, entry_words)
+                    for entry, entry_words in zip(entries, words)
+                    if entry[LI.ROWID] not in self.rows
+                    and entry[LI.ROWID] not in self.removed]
+        if not new_rows:
+            return
+        first = len(self.entries)
+        self.beginInsertRows(QModelIndex(), first, first + len(new_rows) - 1)
+        for row, (entry, entry_words) in enumerate(new_rows, first):
+            self.rows[entry[LI.ROWID]] = row
+            self.entries.append(entry)
+            self.words.append(entry_words)
+        self.endInsertRows()
+
+    def add_entry(self, entry):
+        """Appends the row of a series just written, even if a series
+        with the same rowid was removed earlier"""
+        self.removed.discard(entry[LI.ROWID])
+        self.add_entries([entry])
+
+    def update_entry(self, entry):
+        """Replaces the row with the same rowid as entry, if present"""
+        row = self.rows.get(entry[LI.ROWID])
+        if row is not None:
+            self.entries[row] = entry
+            self.words[row] = index_words(entry, LIST_COLUMNS)
+            self.series_cache.pop(entry[LI.ROWID], None)
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def remove_rowid(self, rowid):
+        """Removes the row of the series with the given rowid, if present,
+        and keeps it from being added back by a list load"""
+        self.removed.add(rowid)
+        row = self.rows.pop(rowid, None)
+        self.series_cache.pop(rowid, None)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.entries[row]
+        del self.words[row]
+        for entry in self.entries[row:]:
+            self.rows[entry[LI.ROWID]] -= 1
+        self.endRemoveRows()
+
+    def series(self, rowid):
+        """Returns the Series with the given rowid, or None if not present"""
+        series = self.series_cache.get(rowid)
+        if series is not None:
+            self.series_cache.move_to_end(rowid)
+            return series
+
+        row = self.rows.get(rowid)
+        if row is None:
+            return None
+        series = list_entry_to_series(self.entries[row])
+        self.series_cache[rowid] = series
+        if len(self.series_cache) > SERIES_CACHE_SIZE:
+            self.series_cache.popitem(last=False)
+        return series
+
+    def index_of(self, rowid):
+        """Returns the index of the series with the given rowid"""
+        row = self.rows.get(rowid)
+        return QModelIndex() if row is None else self.index(row)
+
+
+class SeriesFilterProxyModel(QSortFilterProxyModel):
+    """
+    SeriesFilterProxyModel(QSortFilterProxyModel)
+    Sorts and filters the rows of a SeriesListModel in memory. Rows
+    are sorted by one of the text columns, ignoring case, then by name,
+    with series whose value is unknown placed last. Rows are shown if
+    the function set by set_filter() returns True for them, called as
+    matches(entry, words) with the row's index_words().
+    """
+    def __init__(self, parent=None):
+        super(SeriesFilterProxyModel, self).__init__(parent)
+        self.order = LI.NAME
+        self.matches = lambda entry, words: True
+        self.setDynamicSortFilter(True)
+
+    def set_order(self, order):
+        """Sorts by the column named order"""
+        self.order = LI[order.upper()]
+        self.invalidate()
+
+    def set_filter(self, matches):
+        """Shows only the rows for which matches(entry, words) is True"""
+        self.matches = matches
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        model = self.sourceModel()
+        return self.matches(model.entries[source_row],
+                            model.words[source_row])
+
+    def lessThan(self, left, right):
+        entries = self.sourceModel().entries
+        return (self.sort_key(entries[left.row()])
+                < self.sort_key(entries[right.row()]))
+
+    def sort_key(self, entry):
+        """Returns the key a row is sorted by"""
+        value = str(entry[self.order])
+        return (value in ["Unknown", ""], value.casefold(),
+                str(entry[LI.NAME]).casefold())
 
 
 class MangaTrackerConfigWindow(QDialog, ui_configdialog.Ui_ConfigDialog):
@@ -69,13 +328,21 @@ class MangaTrackerConfigWindow(QDialog, ui_configdialog.Ui_ConfigDialog):
         if name == self.config.database_name:
             self.close()
         elif is_database(name):
+            # swap the shared connection over to the new database,
+            # setting it up if the table doesn't exist
+            try:
+                shared_manager(name, init_database, False)
+            except MigrationError as error:
+                # keep using the current database
+                shared_manager(self.config.database_name)
+                self.results_dialog.setText(str(error))
+                self.results_dialog.show()
+                return
+
             self.config.set_property("database_name", name)
             self.results_dialog.setText("Database name has been changed. ")
             self.results_dialog.show()
 
-            # set up database if table doesn't exist
-            DatabaseManager(name, init_database, False)
-
             self.close()
         else:
             self.results_dialog.setText("Database name must match "
@@ -97,11 +364,8 @@ class MangaTrackerAddWindow(QDialog, ui_addseries.Ui_AddSeries):
     def validate_cells(self, item):
         if item.row() == 0:  # Name
             name = item.text()
-            data_mgr = DatabaseManager(Config().database_name, None)
-            cur = data_mgr.query("SELECT name FROM Series WHERE name = '{0}'"
-                                 .format(name.replace("'", "''")))
-            row = cur.fetchall()
-            if row or name in ["", "Unknown"]:
+            data_mgr = shared_manager(Config().database_name)
+            if name in ["", "Unknown"] or name_in_use(data_mgr, name):
                 item.setBackground(Qt.red)
             else:
                 item.setBackground(Qt.white)
@@ -117,7 +381,7 @@ class MangaTrackerAddWindow(QDialog, ui_addseries.Ui_AddSeries):
                 item.setBackground(Qt.white)
 
     def add_series(self):
-        data_mgr = DatabaseManager(Config().database_name, None)
+        data_mgr = shared_manager(Config().database_name)
         series_args = {}
         for i in range(self.add_series_table.rowCount()):
             try:
@@ -157,10 +421,11 @@ class MangaTrackerAddWindow(QDialog, ui_addseries.Ui_AddSeries):
         new_series = Series(**series_args)
 
         if new_series.add_series_to_database(data_mgr):
-            cur = data_mgr.query("SELECT rowid FROM series WHERE name='%s'"
-                                 % series_args['name'].replace("'", "''"))
-            self.added = cur.fetchone()[0]
+            self.added = new_series.rowid
             self.close()
+        else:
+            # name taken since it was validated
+            self.add_series_table.item(0, 1).setBackground(Qt.red)
 
     def table_setup(self):
         """Generates table elements for creation of a new series.
@@ -227,9 +492,9 @@ class MangaTrackerEditWindow(QDialog, ui_editseries.Ui_EditSeries):
         self.edit_series_save_button.clicked.connect(self.save_edit)
         self.edit_series_cancel_button.clicked.connect(self.close)
         self.rowid = rowid
-        data_mgr = DatabaseManager(Config().database_name, None)
-        cur = data_mgr.query("SELECT rowid, * FROM Series WHERE rowid = %d"
-                             % rowid)
+        data_mgr = shared_manager(Config().database_name)
+        cur = data_mgr.execute("SELECT rowid, * FROM Series WHERE rowid = ?",
+                               (rowid,))
         self.series = entry_to_series(cur.fetchone())
         self.table_setup(self.series, item)
 
@@ -241,7 +506,8 @@ class MangaTrackerEditWindow(QDialog, ui_editseries.Ui_EditSeries):
         saved to the database and the edit window closes. If 'discard'
         is selected, the window closes without saving any changes. If
         'cancel' is selected, the dialog is closed and editing can
-        continue.
+        continue. If the new name is used by another series, nothing
+        is saved, the name is marked in red and the window stays open.
 
         """
         reserved_words = ["unknown"]
@@ -255,7 +521,7 @@ class MangaTrackerEditWindow(QDialog, ui_editseries.Ui_EditSeries):
             series_keys = ["name", "alt_names", "author",
                            "volumes_owned", "next_volume",
                            "publisher", "is_completed"]
-            data_mgr = DatabaseManager(Config().database_name, None)
+            data_mgr = shared_manager(Config().database_name)
 
             for i in range(len(series_keys)):
                 try:
@@ -268,23 +534,17 @@ class MangaTrackerEditWindow(QDialog, ui_editseries.Ui_EditSeries):
                     if (new_data
                             and self.series.name != new_data
                             and new_data not in reserved_words):
-                        cur = data_mgr.query("SELECT name FROM Series WHERE "
-                                             "name = '{0}'"
-                                             .format(new_data
-                                                     .replace("'", "''")))
-                        row = cur.fetchall()
-                        if not row:
-                            self.series.name = new_data
+                        if name_in_use(data_mgr, new_data,
+                                       self.series.rowid):
+                            self.edit_series_table.item(i, 1).setBackground(
+                                Qt.red)
+                            return
+                        self.series.name = new_data
 
                 elif series_keys[i] == "volumes_owned":
                     if new_data in ["None", "0", ""]:
-                        new_data = generate_volumes_owned("")
-                    else:
-                        new_data = generate_volumes_owned(new_data)
-                    self.series.volumes_owned = new_data
-                    self.series.vol_arr = [int(x) for x in
-                                           self.series.volumes_owned
-                                           .split(',')]
+                        new_data = ""
+                    self.series.set_volumes(parse_volumes(new_data))
 
                 elif series_keys[i] == "next_volume":
                     self.series.next_volume = (self.series
@@ -297,9 +557,13 @@ class MangaTrackerEditWindow(QDialog, ui_editseries.Ui_EditSeries):
                         self.series.is_completed = 0
 
                 else:
-                    self.series.__dict__[series_keys[i]] = new_data
+                    setattr(self.series, series_keys[i], new_data)
 
-            self.series.update_database_entry(data_mgr)
+            if (self.series.update_database_entry(data_mgr)
+                    == WriteResult.NAME_CONFLICT):
+                # name taken since it was checked; nothing was saved
+                self.edit_series_table.item(0, 1).setBackground(Qt.red)
+                return
             self.close()
         elif confirm_dialog == QMessageBox.Discard:
             self.close()
@@ -363,7 +627,7 @@ class MangaTrackerGUI(QMainWindow, ui_mainwindow.Ui_MainWindow):
 
     Contains a list of all series in the database on the left, and a
     table on the right to show the currently selected series. A user
-    can filter the list using a search bar directly above the list. A
+    can search the list using a filter bar directly above the list. A
     user can add a series, remove a series, change settings, edit a
     series, add the next volume for a series, or mark a series as
     completed using buttons at the bottom of the window.
@@ -375,10 +639,27 @@ class MangaTrackerGUI(QMainWindow, ui_mainwindow.Ui_MainWindow):
         self.setupUi(self)
         self.set_styles()
 
+        self.list_model = SeriesListModel(self)
+        self.list_proxy = SeriesFilterProxyModel(self)
+        self.list_proxy.setSourceModel(self.list_model)
+        self.list_proxy.sort(0)
+        self.list_series.setModel(self.list_proxy)
+        # Rows are all one line, so the view only asks for the text of
+        # the rows it shows
+        self.list_series.setUniformItemSizes(True)
+
         self.create_filter_menu()
 
-        self.list_series.currentItemChanged.connect(self.display_series)
-        self.filter_series.textChanged.connect(self.filter_series_list)
+        self.list_series.selectionModel().currentChanged.connect(
+            self.display_series)
+        self.filter_series.setPlaceholderText(
+            "Filter (ex. author:oda completed:no gaps:yes)")
+        # Refilter once typing pauses, not on every key
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(FILTER_DELAY)
+        self.filter_timer.timeout.connect(self.update_list_filter)
+        self.filter_series.textChanged.connect(self.schedule_list_filter)
 
         self.settings_button.clicked.connect(self.open_config_window)
 
@@ -388,14 +669,17 @@ class MangaTrackerGUI(QMainWindow, ui_mainwindow.Ui_MainWindow):
         self.mark_as_completed_button.clicked.connect(self.toggle_is_completed)
         self.add_next_volume_button.clicked.connect(self.add_next_volume)
 
+        self.list_loader = None
+        self.list_generation = 0
+        self.list_database = None
         self.get_list_items()
 
     def set_styles(self):
         """Sets styling for list items."""
         self.list_series.setStyleSheet(
-            "QListWidget::item {padding-top:8px;"
+            "QListView::item {padding-top:8px;"
             "padding-bottom:8px; border:1px solid #5DA9F6;}"
-            "QListWidget::item:selected{background:#5DA9F6;}")
+            "QListView::item:selected{background:#5DA9F6;}")
 
     def create_filter_menu(self):
         """Creates and populates the filter button menu.
@@ -460,17 +744,17 @@ class MangaTrackerGUI(QMainWindow, ui_mainwindow.Ui_MainWindow):
         self.no_filter_action.setChecked(True)
         self.sort_name_action.setChecked(True)
 
-        # Refresh series list when options changed
-        self.no_filter_action.toggled.connect(self.get_list_items)
-        self.gaps_action.toggled.connect(self.get_list_items)
-        self.completed_action.toggled.connect(self.get_list_items)
-        self.incomplete_action.toggled.connect(self.get_list_items)
-        self.wishlist_action.toggled.connect(self.get_list_items)
+        # Refilter or re-sort series list in memory when options changed
+        self.no_filter_action.toggled.connect(self.update_list_filter)
+        self.gaps_action.toggled.connect(self.update_list_filter)
+        self.completed_action.toggled.connect(self.update_list_filter)
+        self.incomplete_action.toggled.connect(self.update_list_filter)
+        self.wishlist_action.toggled.connect(self.update_list_filter)
 
-        self.sort_name_action.toggled.connect(self.get_list_items)
-        self.sort_author_action.toggled.connect(self.get_list_items)
-        self.sort_publisher_action.toggled.connect(self.get_list_items)
-        self.sort_alt_names_action.toggled.connect(self.get_list_items)
+        self.sort_name_action.toggled.connect(self.update_list_order)
+        self.sort_author_action.toggled.connect(self.update_list_order)
+        self.sort_publisher_action.toggled.connect(self.update_list_order)
+        self.sort_alt_names_action.toggled.connect(self.update_list_order)
 
         # Add menu to filter button
         self.filter_button.setMenu(self.filter_button_menu)
@@ -494,30 +778,43 @@ class MangaTrackerGUI(QMainWindow, ui_mainwindow.Ui_MainWindow):
         # Fallback
         return "name"
 
+    def current_rowid(self):
+        """Returns rowid of selected series, or None if none selected"""
+        index = self.list_series.currentIndex()
+        return index.data(Qt.UserRole) if index.isValid() else None
+
+    def select_series(self, rowid):
+        """Selects the series with the given rowid, if it is shown"""
+        index = self.list_proxy.mapFromSource(
+            self.list_model.index_of(rowid))
+        if index.isValid():
+            self.list_series.setCurrentIndex(index)
+        return index.isValid()
+
     def toggle_is_completed(self):
         """Toggles completion status of selected series."""
-        data_mgr = DatabaseManager(Config().database_name, None)
-        if self.list_series.currentItem():
-            series_rowid = self.list_series.currentItem().data(Qt.UserRole)
-            cur = data_mgr.query("SELECT rowid, * FROM Series WHERE rowid = %d"
-                                 % series_rowid)
+        data_mgr = shared_manager(Config().database_name)
+        series_rowid = self.current_rowid()
+        if series_rowid is not None:
+            cur = data_mgr.execute("SELECT rowid, * FROM Series "
+                                   "WHERE rowid = ?", (series_rowid,))
             series = entry_to_series(cur.fetchone())
             series.is_completed ^= 1
             series.update_database_entry(data_mgr)
-            self.get_list_items()
+            self.refresh_series(series_rowid)
 
     def add_next_volume(self):
         """Adds next volume to selected series."""
-        data_mgr = DatabaseManager(Config().database_name, None)
-        if self.list_series.currentItem():
-            series_rowid = self.list_series.currentItem().data(Qt.UserRole)
-            cur = data_mgr.query("SELECT rowid, * FROM Series WHERE rowid = %d"
-                                 % series_rowid)
+        data_mgr = shared_manager(Config().database_name)
+        series_rowid = self.current_rowid()
+        if series_rowid is not None:
+            cur = data_mgr.execute("SELECT rowid, * FROM Series "
+                                   "WHERE rowid = ?", (series_rowid,))
             series = entry_to_series(cur.fetchone())
             if not series.is_completed:
                 series.add_volumes(str(series.next_volume))
                 series.update_database_entry(data_mgr)
-                self.get_list_items()
+                self.refresh_series(series_rowid)
 
     def remove_series(self):
         """Remove selected series from database
@@ -526,11 +823,11 @@ class MangaTrackerGUI(QMainWindow, ui_mainwindow.Ui_MainWindow):
         prompting the user for confirmation.
 
         """
-        data_mgr = DatabaseManager(Config().database_name, None)
-        if self.list_series.currentItem():
-            series_rowid = self.list_series.currentItem().data(Qt.UserRole)
-            cur = data_mgr.query("SELECT rowid, * FROM Series WHERE rowid = %d"
-                                 % series_rowid)
+        data_mgr = shared_manager(Config().database_name)
+        series_rowid = self.current_rowid()
+        if series_rowid is not None:
+            cur = data_mgr.execute("SELECT rowid, * FROM Series "
+                                   "WHERE rowid = ?", (series_rowid,))
             series = entry_to_series(cur.fetchone())
             confirm_dialog = QMessageBox.question(
                 self, "Remove %s" % series.name,
@@ -540,50 +837,98 @@ class MangaTrackerGUI(QMainWindow, ui_mainwindow.Ui_MainWindow):
                 QMessageBox.Cancel)
             if confirm_dialog == QMessageBox.Discard:
                 remove_series_from_database(data_mgr, series)
-                self.list_series.takeItem(self.list_series.currentRow())
+                self.list_model.remove_rowid(series_rowid)
                 self.list_series.setFocus()
 
     def open_config_window(self):
         self.config_window = MangaTrackerConfigWindow()
         self.config_window.setWindowModality(Qt.ApplicationModal)
-        self.config_window.finished.connect(self.get_list_items)
+        self.config_window.finished.connect(self.finish_config_window)
         self.config_window.show()
 
+    def finish_config_window(self):
+        """Reloads the list if the database changed, else refilters it"""
+        if Config().database_name != self.list_database:
+            self.get_list_items()
+        else:
+            self.update_list_filter()
+
     def open_add_window(self):
         """Opens window to add a new series
 
         Initializes the MangaTrackerAddWindow class. Triggers
-        get_list_items when the add series window is closed
+        finish_add_window when the add series window is closed
 
         """
         self.add_window = MangaTrackerAddWindow()
         self.add_window.setWindowModality(Qt.ApplicationModal)
-        self.add_window.finished.connect(self.get_list_items)
+        self.add_window.finished.connect(self.finish_add_window)
         self.add_window.show()
 
+    def finish_add_window(self):
+        """Adds the new series to the list, if any, and selects it"""
+        if self.add_window.added > -1:
+            self.refresh_series(self.add_window.added)
+            self.select_series(self.add_window.added)
+            self.add_window.added = -1
+
     def open_edit_window(self):
         """Opens edit window for selected series.
 
         Retrieves the unique rowid for the selected series, and
         initializes the MangaTrackerEditWindow() class. Triggers
-        display_series() when edit window is closed.
+        finish_edit_window() when edit window is closed.
 
         """
-        series_rowid = self.list_series.currentItem().data(Qt.UserRole)
+        series_rowid = self.current_rowid()
         self.edit_window = MangaTrackerEditWindow(series_rowid)
         self.edit_window.setWindowModality(Qt.ApplicationModal)
-        self.edit_window.finished.connect(self.display_series)
+        self.edit_window.finished.connect(self.finish_edit_window)
         self.edit_window.show()
 
     def open_edit_window_from_table(self, row, column):
         """Opens edit window with selected property in edit mode."""
-        series_rowid = self.list_series.currentItem().data(Qt.UserRole)
+        series_rowid = self.current_rowid()
         self.edit_window = MangaTrackerEditWindow(
             series_rowid, item=self.series_info_display.item(row, 0).text())
         self.edit_window.setWindowModality(Qt.ApplicationModal)
-        self.edit_window.finished.connect(self.display_series)
+        self.edit_window.finished.connect(self.finish_edit_window)
         self.edit_window.show()
 
+    def finish_edit_window(self):
+        """Updates the list row of the series edited"""
+        self.refresh_series(self.edit_window.rowid)
+
+    def refresh_series(self, rowid):
+        """Updates the list after the series with rowid is written.
+
+        Reads only that series again, then updates, inserts or removes
+        its row in the list model. The proxy model re-sorts and
+        refilters just that row, so the cost doesn't grow with the size
+        of the collection. The series is displayed again if selected;
+        if it no longer matches the filters, the first series shown is
+        selected instead.
+
+        """
+        was_selected = rowid == self.current_rowid()
+        data_mgr = shared_manager(Config().database_name)
+        entry = data_mgr.execute("SELECT %s FROM Series WHERE rowid = ?"
+                                 % ", ".join(LIST_COLUMNS),
+                                 (rowid,)).fetchone()
+        if entry is None:
+            self.list_model.remove_rowid(rowid)
+        elif self.list_model.index_of(rowid).isValid():
+            self.list_model.update_entry(entry)
+        else:
+            self.list_model.add_entry(entry)
+
+        if was_selected and self.current_rowid() == rowid:
+            self.display_series()
+        elif self.current_rowid() is None:
+            self.list_series.setCurrentIndex(self.list_proxy.index(0, 0))
+            if self.current_rowid() is None:
+                self.clear_table()
+
     def table_setup(self, series):
         """Generates table elements based on series.
 
@@ -613,102 +958,112 @@ class MangaTrackerGUI(QMainWindow, ui_mainwindow.Ui_MainWindow):
             self.series_info_display.setItem(i, 0, headerItem)
             self.series_info_display.setItem(i, 1, dataItem)
 
-    def display_series(self):
-        """Retrieves and displays info for selected series.
+    def display_series(self, *args):
+        """Displays info for selected series.
 
         This function retrieves the unique rowid for the selected
-        series and retrieves the series from the database. It then
-        updates all main window elements which show series info to
-        show up-to-date properties. Once all series information is
-        properly displayed, buttons which can change the selected
-        series's properties are enabled.
+        series and gets the series from the list model, which holds
+        every series loaded from the database, so moving through the
+        list never queries the database. It then updates all main
+        window elements which show series info to show its properties.
+        Once all series information is properly displayed, buttons
+        which can change the selected series's properties are enabled.
+
+        The series next to the selected one are built ahead of time,
+        ready for the next move through the list.
 
         """
-        data_mgr = DatabaseManager(Config().database_name, None)
-        if self.list_series.currentItem():
-            series_rowid = self.list_series.currentItem().data(Qt.UserRole)
-            cur = data_mgr.query("SELECT rowid, * FROM Series WHERE rowid = %d"
-                                 % series_rowid)
-            series = entry_to_series(cur.fetchone())
+        series_rowid = self.current_rowid()
+        if series_rowid is not None:
+            series = self.list_model.series(series_rowid)
 
             if series:
-                self.list_series.currentItem().setText(series.compact_string())
                 self.table_setup(series)
                 self.edit_series_button.setEnabled(True)
                 self.remove_series_button.setEnabled(True)
                 self.add_next_volume_button.setEnabled(True)
                 self.mark_as_completed_button.setEnabled(True)
+                self.prefetch_series()
 
-    def filter_series_list(self):
-        """Hides list elements whose text does not contain a user-provided string.
+    def prefetch_series(self):
+        """Builds the series within PREFETCH_ROWS of the selected one"""
+        row = self.list_series.currentIndex().row()
+        for neighbour in range(row - PREFETCH_ROWS, row + PREFETCH_ROWS + 1):
+            index = self.list_proxy.index(neighbour, 0)
+            if neighbour != row and index.isValid():
+                self.list_model.series(index.data(Qt.UserRole))
 
-        When the text in the filter bar above the list is edited, this
-        function takes the updated text and compares it to each
-        element of the list. If the series string in the list element
-        does not contain the updated text, the element will be
-        hidden. As a result, the filter only works on name, author,
-        and 'Completed'; functionality for filtering by other
-        properties is planned for future updates.
+    def get_list_filter(self):
+        """Returns conditions for any filters set in filter_button
 
-        """
-        filter_text = self.filter_series.text()
-        # If empty string, make sure all items are visible
-        if not filter_text:
-            for i in range(self.list_series.count()):
-                self.list_series.item(i).setHidden(False)
-            return
-
-        matches = self.list_series.findItems(filter_text, Qt.MatchContains)
-
-        # # Can't use this because 'if item in matches' throws
-        # # 'Operator not implemented' error
-        # for i in range(self.list_series.count()):
-        #     item = self.list_series.item(i)
-        #     print(item)
-        #     if item in matches:
-        #         item.setHidden(False)
-        #     else:
-        #         item.setHidden(True)
-
-        # Hide all items, then show items which match filter
-        for i in range(self.list_series.count()):
-            self.list_series.item(i).setHidden(True)
-        for i in matches:
-            i.setHidden(False)
-
-    def check_filters(self, series):
-        """Compare series to any filters set in filter_button
-
-        If any of the filters in the filter_button_menu are selected,
-        this function returns True if the series matches the selected
-        filter and False if it does not. If no filter is selected,
-        this function always returns True.
+        Conditions are (column, value) pairs, where column is one of
+        ListItems. If any of the filters in the filter_button_menu are
+        selected, only series whose row has every column equal to its
+        value are shown.
 
         """
+        conditions = []
         if (not Config().show_empty_series
                 and not self.wishlist_action.isChecked()):
-            if series.volumes_owned == "0,0,0,0":
-                return False
+            conditions.append((LI.IS_EMPTY, 0))
 
         if self.gaps_action.isChecked():
-            binary_str = series.get_volumes_owned_binary()
-            if regexp("1*0+1", binary_str):
-                return True
-            return False
+            conditions.append((LI.HAS_GAPS, 1))
 
         elif self.completed_action.isChecked():
-            return series.is_completed
+            conditions.append((LI.IS_COMPLETED, 1))
 
         elif self.incomplete_action.isChecked():
-            return not series.is_completed
+            conditions.append((LI.IS_COMPLETED, 0))
 
         elif self.wishlist_action.isChecked():
-            if series.volumes_owned == "0,0,0,0":
-                return True
-            return False
+            conditions.append((LI.IS_EMPTY, 1))
 
-        else:
-            return True
+        return conditions
+
+    def schedule_list_filter(self, text):
+        """Refilters the series list FILTER_DELAY ms after typing stops"""
+        self.filter_timer.start()
+
+    def update_list_filter(self, checked=True):
+        """Refilters the series list in memory
+
+        Shows only series matching both the filter menu and the query
+        in the filter bar (see seriesquery.py). If the selected series
+        is hidden, the first series shown is selected instead.
+
+        """
+        # Only the newly checked action of the filter group refilters
+        if not checked:
+            return
+        self.filter_timer.stop()
+        try:
+            query_matches = compile_filter(self.filter_series.text(),
+                                           LIST_COLUMNS)
+        except SearchSyntaxError as error:
+            # Keep the current list until the query is valid again
+            self.filter_series.setToolTip(str(error))
+            return
+        self.filter_series.setToolTip("")
+
+        conditions = self.get_list_filter()
+        had_selection = self.current_rowid() is not None
+        self.list_proxy.set_filter(
+            lambda entry, words: (all(entry[column] == value
+                                      for column, value in conditions)
+                                  and query_matches(entry, words)))
+
+        if had_selection and self.current_rowid() is None:
+            self.list_series.setCurrentIndex(self.list_proxy.index(0, 0))
+        if self.current_rowid() is None:
+            self.clear_table()
+
+    def update_list_order(self, checked=True):
+        """Re-sorts the series list in memory by the selected order"""
+        # Only the newly checked action of the group needs to re-sort
+        if checked:
+            self.list_proxy.set_order(self.get_list_order())
+            self.list_series.scrollTo(self.list_series.currentIndex())
 
     def clear_table(self):
         """Clear series info from display table and disable buttons"""
@@ -721,77 +1076,98 @@ class MangaTrackerGUI(QMainWindow, ui_mainwindow.Ui_MainWindow):
         self.mark_as_completed_button.setEnabled(False)
 
     def get_list_items(self):
-        """Retrieves all series from database and populates list in main window.
+        """Starts loading all series from database into list in main window.
 
-        Populates the list in the main window with the compact_string()
-        representations of all the series in the database, sorting by the
-        given property (default "name") and placing any series with an
-        unknown value for that property at the end of the list
+        Fills the list model with a row of LIST_COLUMNS for every series
+        in the database. The list shows the compact_string()
+        representations of the series, sorted and filtered in memory
+        (see update_list_order() and update_list_filter()), so changing
+        the order or filters doesn't load the series again.
+
+        The query runs on a worker thread (see ListLoader) and rows are
+        added to the list as they arrive, so the window stays responsive
+        on a large collection. Starting a new load cancels any load
+        still running.
 
         """
-        order = self.get_list_order()
-        data_mgr = DatabaseManager(Config().database_name, None)
-        cur = data_mgr.query("SELECT rowid, * FROM Series ORDER BY %s "
-                             "COLLATE NOCASE ASC, name ASC;" % order)
-        entries = cur.fetchall()
-        unknown_entries = []
-        selected_series = None
-        selected_series_found = False
-
-        if self.list_series.currentItem():
-            selected_series = self.list_series.currentItem().data(Qt.UserRole)
-        if hasattr(self, "add_window") and self.add_window.added > -1:
-            selected_series = self.add_window.added
-            self.add_window.added = -1
+        data_mgr = shared_manager(Config().database_name)
+        if self.list_loader is not None:
+            self.list_loader.cancel()
+
+        self.selected_series = self.current_rowid()
+        self.selected_series_found = False
+
+        self.list_model.clear()
+        self.list_database = Config().database_name
+        # Filters depend on config, which may have changed
+        self.update_list_filter()
+
+        self.list_generation += 1
+        self.list_loader = ListLoader(self.list_generation, data_mgr,
+                                      LIST_COLUMNS)
+        self.list_loader.signals.rows_loaded.connect(self.add_list_items)
+        self.list_loader.signals.finished.connect(self.finish_list_items)
+        self.list_loader.signals.failed.connect(self.fail_list_items)
+        QThreadPool.globalInstance().start(self.list_loader)
+
+    def add_list_items(self, generation, entries, words):
+        """Adds a batch of rows loaded by get_list_items() to the list"""
+        if generation != self.list_generation:
+            return
+
+        self.list_model.add_entries(entries, words)
+        if self.selected_series is not None and not self.selected_series_found:
+            self.selected_series_found = self.select_series(
+                self.selected_series)
 
-        self.list_series.clear()
-        for entry in entries:
-            if entry[SI[order.upper()]] in ["Unknown", ""]:
-                unknown_entries.append(entry)
-                continue
-            series = entry_to_series(entry)
-
-            # Check if any filters are selected.
-            if not self.check_filters(series):
-                continue
-
-            series_item = QListWidgetItem(series.compact_string())
-            series_item.setData(Qt.UserRole, series.rowid)
-            self.list_series.addItem(series_item)
-            if selected_series and selected_series == series.rowid:
-                self.list_series.setCurrentItem(series_item)
-                selected_series_found = True
-
-        for entry in unknown_entries:
-            series = entry_to_series(entry)
-            series_item = QListWidgetItem(series.compact_string())
-            series_item.setData(Qt.UserRole, series.rowid)
-            self.list_series.addItem(series_item)
-            if selected_series and selected_series == series.rowid:
-                self.list_series.setCurrentItem(series_item)
-                selected_series_found = True
+    def finish_list_items(self, generation):
+        """Fixes the selection once get_list_items() finishes"""
+        if generation != self.list_generation:
+            return
+        self.list_loader = None
 
         # If previous series item no longer exists, select first entry in list
-        if selected_series and not selected_series_found:
-            self.list_series.setCurrentRow(0)
+        if self.selected_series is not None and not self.selected_series_found:
+            self.list_series.setCurrentIndex(self.list_proxy.index(0, 0))
 
-        if not self.list_series.currentItem():
+        if self.current_rowid() is None:
             self.clear_table()
 
-        self.filter_series_list()
+    def fail_list_items(self, generation, error):
+        """Shows why get_list_items() failed, keeping the rows loaded"""
+        if generation != self.list_generation:
+            return
+        self.list_loader = None
+        self.filter_series.setToolTip(error)
 
+    def closeEvent(self, event):
+        """Cancels any list load still running when the window closes"""
+        if self.list_loader is not None:
+            self.list_loader.cancel()
+        super(MangaTrackerGUI, self).closeEvent(event)
 
 def gui_main():
     """Starts the main window for MangaTracker GUI"""
     # initialize config file and database file if needed
     config = Config()
-    DatabaseManager(config.database_name, init_database, False)
-
     app = QApplication(sys.argv)
+    try:
+        shared_manager(config.database_name, init_database, False,
+                       config.busy_timeout)
+    except MigrationError as error:
+        # There's no console to print to; show why the database can't
+        # be opened instead of exiting silently
+        QMessageBox.critical(None, "MangaTracker", str(error))
+        close_shared_manager()
+        return
+
     main_window = MangaTrackerGUI()
 
     main_window.show()
     app.exec_()
+    # Workers must return their pooled connections before closing
+    QThreadPool.globalInstance().waitForDone()
+    close_shared_manager()
 
 
 if __name__ == "__main__":
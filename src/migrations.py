@@ -0,0 +1,271 @@
+""" migrations.py
+Versioned schema migrations for the Series table
+
+Each migration upgrades the database schema by one version, tracked
+with PRAGMA user_version. Migrations are applied in order by
+DatabaseManager.migrate(), each in its own transaction. Once released,
+a migration must not be changed; add a new one instead.
+
+Copyright 2020 by Nicholas Bishop
+"""
+
+import sqlite3 as lite
+from volumeset import VolumeSet
+
+class MigrationError(Exception):
+    """
+    Raised by a migration which can't be applied to the data in the
+    database; the message tells the user what to change first
+    """
+
+
+# Registered migrations, as (version, description, function) tuples in
+# ascending order of version
+SERIES_MIGRATIONS = []
+
+# Schema of the Series table before any migration (user_version 0)
+ORIGINAL_SERIES_SCHEMA = ("CREATE TABLE Series(name TEXT, "
+                          "volumes_owned TEXT, is_completed INT, "
+                          "next_volume INT, publisher TEXT, author TEXT, "
+                          "alt_names TEXT, PRIMARY KEY(name))")
+
+
+def migration(version, description):
+    """
+    migration(version, description)
+    Decorator registering a function as the migration to the given
+    schema version. The function receives a DatabaseManager and must
+    leave the database at that version.
+    """
+    def register(func):
+        if SERIES_MIGRATIONS and SERIES_MIGRATIONS[-1][0] >= version:
+            raise ValueError("Migration %d registered out of order"
+                             % version)
+        SERIES_MIGRATIONS.append((version, description, func))
+        return func
+    return register
+
+
+def get_columns(data_mgr, table):
+    """Returns the (name, declared type) of each column in table"""
+    # table_info rows are (cid, name, type, notnull, default, pk)
+    return [(col[1], col[2].upper()) for col in
+            data_mgr.execute("PRAGMA table_info(%s)" % table).fetchall()]
+
+
+@migration(1, "Store volumes_owned as a packed BLOB")
+def migrate_volumes_to_blob(data_mgr):
+    """
+    migrate_volumes_to_blob()
+    Converts volumes_owned from comma-separated text (ex. '3,0,0,0') to
+    the packed BLOB format, rebuilding the table and keeping every
+    rowid. Skipped if volumes_owned is already declared as a BLOB.
+    """
+    if ("volumes_owned", "BLOB") in get_columns(data_mgr, "Series"):
+        return
+
+    entries = data_mgr.execute("SELECT rowid, name, volumes_owned, "
+                               "is_completed, next_volume, publisher, "
+                               "author, alt_names FROM Series").fetchall()
+    data_mgr.execute("CREATE TABLE Series_migrated(name TEXT, "
+                     "volumes_owned BLOB, is_completed INT, "
+                     "next_volume INT, publisher TEXT, author TEXT, "
+                     "alt_names TEXT, PRIMARY KEY(name))")
+    data_mgr.executemany(
+        "INSERT INTO Series_migrated(rowid, name, volumes_owned, "
+        "is_completed, next_volume, publisher, author, alt_names) "
+        "VALUES(?,?,?,?,?,?,?,?)",
+        ((entry[0], entry[1], text_to_volumes_blob(entry[2])) + entry[3:]
+         for entry in entries))
+    data_mgr.execute("DROP TABLE Series")
+    data_mgr.execute("ALTER TABLE Series_migrated RENAME TO Series")
+
+
+def text_to_volumes_blob(volumes_text):
+    """Converts a legacy '3,0,0,0' volumes string to the BLOB format"""
+    if isinstance(volumes_text, bytes):
+        return volumes_text
+    bits = 0
+    try:
+        for i, num in enumerate(str(volumes_text).split(',')):
+            bits |= int(num) << (32 * i)
+    except ValueError:
+        bits = 0
+    return VolumeSet(bits).to_bytes()
+
+
+@migration(2, "Add indexed columns derived from volumes_owned")
+def add_derived_columns(data_mgr):
+    """
+    add_derived_columns()
+    Adds volume_count, has_gaps, is_empty and max_volume, indexes for
+    the gaps, wishlist and completion lists ordered by name, and an
+    index on max_volume for owns: searches. Fills the columns in
+    for existing rows; Series objects write them together with
+    volumes_owned afterwards. There are no triggers calling the
+    VOLUME_* SQL functions, so the table can still be written by
+    connections without them (ex. the sqlite3 shell).
+    """
+    columns = [name for name, sql_type in get_columns(data_mgr, "Series")]
+    for name in ("volume_count", "has_gaps", "is_empty", "max_volume"):
+        if name not in columns:
+            data_mgr.execute("ALTER TABLE Series ADD COLUMN %s INT" % name)
+
+    data_mgr.execute("CREATE INDEX IF NOT EXISTS series_is_empty "
+                     "ON Series(is_empty, name)")
+    data_mgr.execute("CREATE INDEX IF NOT EXISTS series_has_gaps "
+                     "ON Series(has_gaps, name)")
+    data_mgr.execute("CREATE INDEX IF NOT EXISTS series_is_completed "
+                     "ON Series(is_completed, name)")
+    data_mgr.execute("CREATE INDEX IF NOT EXISTS series_max_volume "
+                     "ON Series(max_volume)")
+
+    data_mgr.execute("UPDATE Series SET "
+                     "volume_count = VOLUME_COUNT(volumes_owned), "
+                     "has_gaps = VOLUME_HAS_GAPS(volumes_owned), "
+                     "is_empty = VOLUME_COUNT(volumes_owned) = 0, "
+                     "max_volume = VOLUME_MAX(volumes_owned), "
+                     "next_volume = VOLUME_NEXT(volumes_owned)")
+
+
+# Columns of Series indexed for full-text search, in Series_fts order
+SEARCH_COLUMNS = ("name", "publisher", "author", "alt_names")
+
+# Triggers keeping the external content table Series_fts in sync with
+# Series; FTS5 needs the old values to remove a row from the index
+SEARCH_INSERT = ("INSERT INTO Series_fts(rowid, %s) VALUES(NEW.rowid, %s);"
+                 % (", ".join(SEARCH_COLUMNS),
+                    ", ".join("NEW." + col for col in SEARCH_COLUMNS)))
+SEARCH_DELETE = ("INSERT INTO Series_fts(Series_fts, rowid, %s) "
+                 "VALUES('delete', OLD.rowid, %s);"
+                 % (", ".join(SEARCH_COLUMNS),
+                    ", ".join("OLD." + col for col in SEARCH_COLUMNS)))
+SEARCH_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS series_fts_insert "
+    "AFTER INSERT ON Series BEGIN " + SEARCH_INSERT + " END",
+    "CREATE TRIGGER IF NOT EXISTS series_fts_delete "
+    "AFTER DELETE ON Series BEGIN " + SEARCH_DELETE + " END",
+    "CREATE TRIGGER IF NOT EXISTS series_fts_update "
+    "AFTER UPDATE OF " + ", ".join(SEARCH_COLUMNS) + " ON Series BEGIN "
+    + SEARCH_DELETE + " " + SEARCH_INSERT + " END",
+]
+
+
+@migration(3, "Add a full-text search index")
+def add_search_index(data_mgr):
+    """
+    add_search_index()
+    Creates Series_fts, an FTS5 index over the text columns of Series
+    kept in sync by triggers, and indexes existing rows. Skipped if
+    SQLite was built without FTS5; searches then fall back to LIKE.
+    """
+    try:
+        data_mgr.execute("CREATE VIRTUAL TABLE IF NOT EXISTS Series_fts "
+                         "USING fts5(%s, content='Series', "
+                         "content_rowid='rowid', prefix='2 3')"
+                         % ", ".join(SEARCH_COLUMNS))
+    except lite.OperationalError:
+        return
+
+    for statement in SEARCH_TRIGGERS:
+        data_mgr.execute(statement)
+    data_mgr.execute("INSERT INTO Series_fts(Series_fts) VALUES('rebuild')")
+
+
+# Columns which lists may be ordered by, with series whose value is
+# 'Unknown' placed last
+LIST_COLUMNS = ("name", "author", "publisher", "alt_names")
+
+UNKNOWN_FLAGS_UPDATE = (
+    "UPDATE Series SET %s WHERE rowid = NEW.rowid;"
+    % ", ".join("{0}_unknown = NEW.{0} IS 'Unknown'".format(col)
+                for col in LIST_COLUMNS))
+
+
+@migration(4, "Index the list orderings with unknown values last")
+def add_list_indexes(data_mgr):
+    """
+    add_list_indexes()
+    Adds a <column>_unknown flag for each list ordering column, kept up
+    to date by triggers, and an index on (<column>_unknown, <column>)
+    for each ordering. The indexes match the ORDER BY of
+    print_all_series(), so lists are read in index order instead of
+    sorted, and keyset pagination can seek to a position in a list
+    (WHERE (flag, column, rowid) > (?, ?, ?)).
+    """
+    columns = [name for name, sql_type in get_columns(data_mgr, "Series")]
+    for column in LIST_COLUMNS:
+        if column + "_unknown" not in columns:
+            data_mgr.execute("ALTER TABLE Series ADD COLUMN %s_unknown INT"
+                             % column)
+
+    data_mgr.execute("CREATE TRIGGER IF NOT EXISTS series_unknown_insert "
+                     "AFTER INSERT ON Series BEGIN "
+                     + UNKNOWN_FLAGS_UPDATE + " END")
+    data_mgr.execute("CREATE TRIGGER IF NOT EXISTS series_unknown_update "
+                     "AFTER UPDATE OF %s ON Series BEGIN "
+                     % ", ".join(LIST_COLUMNS)
+                     + UNKNOWN_FLAGS_UPDATE + " END")
+
+    for column in LIST_COLUMNS:
+        data_mgr.execute("CREATE INDEX IF NOT EXISTS series_%s_list "
+                         "ON Series(%s_unknown, %s)"
+                         % (column, column, column))
+
+    data_mgr.execute("UPDATE Series SET %s" % ", ".join(
+        "{0}_unknown = {0} IS 'Unknown'".format(col) for col in LIST_COLUMNS))
+
+
+@migration(5, "Make series names unique regardless of case")
+def make_names_case_insensitive(data_mgr):
+    """
+    make_names_case_insensitive()
+    Rebuilds the Series table with name declared COLLATE NOCASE, so the
+    primary key rejects names differing from an existing name only in
+    case. Every rowid is kept, and the indexes and triggers on the
+    table are recreated.
+
+    Raises MigrationError listing the series whose names differ only
+    in case, if any; series are never renamed without the user
+    choosing the new names.
+    """
+    columns = get_columns(data_mgr, "Series")
+    schema = [row[0] for row in data_mgr.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = 'Series' "
+        "AND type IN ('index', 'trigger') AND sql IS NOT NULL")]
+
+    collisions = data_mgr.execute(
+        "SELECT rowid, name FROM Series WHERE lower(name) IN "
+        "(SELECT lower(name) FROM Series GROUP BY lower(name) "
+        "HAVING COUNT(*) > 1) ORDER BY lower(name), rowid").fetchall()
+    if collisions:
+        raise MigrationError(
+            "Can't upgrade %s: series names must differ by more than "
+            "case. Rename or remove all but one series of each group "
+            "below, ex. in the sqlite3 shell with\n"
+            "  UPDATE Series SET name = 'New Name' WHERE rowid = <rowid>;\n"
+            "then open the database again.\n%s"
+            % (data_mgr.database_name,
+               "\n".join("  rowid %d: '%s'" % (rowid, name)
+                         for rowid, name in collisions)))
+
+    column_names = [name for name, sql_type in columns]
+    entries = data_mgr.execute("SELECT rowid, %s FROM Series ORDER BY rowid"
+                               % ", ".join(column_names)).fetchall()
+
+    data_mgr.execute("CREATE TABLE Series_migrated(%s, PRIMARY KEY(name))"
+                     % ", ".join(name + " " + sql_type
+                                 + (" COLLATE NOCASE" if name == "name"
+                                    else "")
+                                 for name, sql_type in columns))
+    data_mgr.executemany("INSERT INTO Series_migrated(rowid, %s) VALUES(%s)"
+                         % (", ".join(column_names),
+                            ", ".join("?" * (len(columns) + 1))), entries)
+    data_mgr.execute("DROP TABLE Series")
+    data_mgr.execute("ALTER TABLE Series_migrated RENAME TO Series")
+
+    for statement in schema:
+        data_mgr.execute(statement)
+    if data_mgr.has_table("Series_fts"):
+        data_mgr.execute("INSERT INTO Series_fts(Series_fts) "
+                         "VALUES('rebuild')")
@@ -0,0 +1,134 @@
+""" paginator.py
+Keyset pagination over SQL queries
+
+Copyright 2020 by Nicholas Bishop
+"""
+
+
+class KeysetPaginator():
+    """
+    KeysetPaginator(object)
+
+    Fetches the rows of a query one page at a time. Each page is a
+    separate query starting after the sort key of the last row of the
+    previous page (WHERE (keys) > (?, ...) ... LIMIT n), so with an
+    index on the sort keys, fetching any page costs the same however
+    many rows come before it. The first row key of each page visited
+    is kept so earlier pages can be fetched again.
+    """
+    def __init__(self, data_mgr, table, sort_keys, condition="", params=(),
+                 page_size=0, columns="rowid, *"):
+        """
+        __init__(self, data_mgr, table, sort_keys, condition, params,
+                 page_size, columns)
+        Create a paginator selecting columns from table, ordered by the
+        SQL expressions in sort_keys. The last sort key must be unique
+        (ex. rowid) so every row has a distinct position. condition and
+        params optionally restrict the rows. A page_size of 0 fetches
+        every row as one page.
+        """
+        self.data_mgr = data_mgr
+        self.table = table
+        self.sort_keys = list(sort_keys)
+        self.condition = condition
+        self.params = tuple(params)
+        self.page_size = page_size
+        self.columns = columns
+
+        # page_starts[i] is the sort key before page i (None for page 0)
+        self.page_starts = [None]
+        self.page = 0
+        self.next_start = None
+
+    def fetch_page(self):
+        """
+        fetch_page()
+        Returns the rows of the current page. Without a page size,
+        returns a generator streaming every row instead of a list.
+        """
+        sql, params = self.page_query()
+        self.next_start = None
+        if not self.page_size:
+            return self.data_mgr.stream(sql, params)
+
+        # One row more than a page shows whether there is another page
+        rows = list(self.data_mgr.stream(sql, params, self.page_size + 1))
+        key_count = len(self.sort_keys)
+        if len(rows) > self.page_size:
+            rows.pop()
+            self.next_start = rows[-1][-key_count:]
+        return [row[:-key_count] for row in rows]
+
+    def rows(self):
+        """
+        rows()
+        Generator yielding every row from the current page on, fetching
+        each page only once the rows before it have been used. With a
+        page size, no query is left open while the caller handles a row.
+        """
+        while True:
+            yield from self.fetch_page()
+            if not self.next_page():
+                return
+
+    def count(self):
+        """Returns the number of rows in every page together"""
+        return self.data_mgr.execute(
+            "SELECT COUNT(*) FROM %s %s" % (
+                self.table,
+                "WHERE " + self.condition if self.condition else ""),
+            self.params).fetchone()[0]
+
+    def page_query(self):
+        """
+        page_query()
+        Returns (sql, params) of the query for the current page. The
+        sort keys are selected after the columns, to find where the
+        next page starts.
+        """
+        conditions = [self.condition] if self.condition else []
+        params = list(self.params)
+        order_by = ", ".join(self.sort_keys)
+        if not self.page_size:
+            return (self.select_sql(self.columns, conditions, order_by),
+                    params)
+
+        start = self.page_starts[self.page]
+        if start is not None:
+            conditions.append("(%s) > (%s)" % (
+                order_by, ", ".join("?" * len(self.sort_keys))))
+            params.extend(start)
+        return (self.select_sql(self.columns + ", " + order_by, conditions,
+                                order_by) + " LIMIT ?",
+                params + [self.page_size + 1])
+
+    def select_sql(self, columns, conditions, order_by):
+        """Returns the SELECT statement for a page"""
+        return "SELECT %s FROM %s %s ORDER BY %s" % (
+            columns, self.table,
+            "WHERE " + " AND ".join(conditions) if conditions else "",
+            order_by)
+
+    def has_next(self):
+        """Returns whether the last page fetched has a page after it"""
+        return self.next_start is not None
+
+    def has_previous(self):
+        """Returns whether the current page has a page before it"""
+        return self.page > 0
+
+    def next_page(self):
+        """Moves to the page after the last page fetched, if any"""
+        if not self.has_next():
+            return False
+        self.page += 1
+        del self.page_starts[self.page:]
+        self.page_starts.append(self.next_start)
+        return True
+
+    def previous_page(self):
+        """Moves to the page before the current page, if any"""
+        if not self.has_previous():
+            return False
+        self.page -= 1
+        return True
@@ -4,11 +4,20 @@ Container for information regarding a manga series
 Copyright 2019 by Nicholas Bishop
 """
 
-import math
+import sqlite3 as lite
 from enum import IntEnum
 from config import Config
 from databasemanager import regexp
+from databasemanager import register_function
+from migrations import ORIGINAL_SERIES_SCHEMA
+from migrations import SERIES_MIGRATIONS
+from volumeset import VolumeSet
 
+# Condition hiding empty series in the lists. Nearly every series
+# matches it, so the unary + keeps SQLite from choosing the is_empty
+# index; the list is then read in the order of the index for its
+# ORDER BY instead of being sorted afterwards.
+NOT_EMPTY = "+is_empty = 0"
 
 class SeriesItems(IntEnum):
     """
@@ -26,6 +35,84 @@ class SeriesItems(IntEnum):
     PUBLISHER = 5
     AUTHOR = 6
     ALT_NAMES = 7
+    VOLUME_COUNT = 8
+    HAS_GAPS = 9
+    IS_EMPTY = 10
+    MAX_VOLUME = 11
+    NAME_UNKNOWN = 12
+    AUTHOR_UNKNOWN = 13
+    PUBLISHER_UNKNOWN = 14
+    ALT_NAMES_UNKNOWN = 15
+
+
+# Columns of the Series table written by Series objects, in table order
+SERIES_FIELDS = ("name", "volumes_owned", "is_completed", "next_volume",
+                 "publisher", "author", "alt_names")
+
+# Columns of the Series table derived from volumes_owned, written
+# together with it in the order given by Series.derived_columns()
+DERIVED_FIELDS = ("volume_count", "has_gaps", "is_empty", "max_volume")
+
+# Fields stripped of surrounding whitespace when written
+TEXT_FIELDS = ("name", "publisher", "author", "alt_names")
+
+# Slots holding fields which are accessed through a property
+STORED_FIELDS = {"volumes_owned": "_volumes_owned",
+                 "next_volume": "_next_volume"}
+
+# Columns selected to show a series with compact_entry_string(), in the
+# order given by CompactItems
+COMPACT_COLUMNS = ("rowid", "name", "author", "is_completed", "next_volume")
+
+class CompactItems(IntEnum):
+    """
+    CompactItems(IntEnum)
+
+    An enum tracking the column numbers for each series property, when
+    selecting COMPACT_COLUMNS from the Series table.
+    """
+    ROWID = 0
+    NAME = 1
+    AUTHOR = 2
+    IS_COMPLETED = 3
+    NEXT_VOLUME = 4
+
+# Columns selected for the GUI series list: COMPACT_COLUMNS followed by
+# the columns it is sorted and filtered by in memory, in the order
+# given by ListItems
+LIST_COLUMNS = COMPACT_COLUMNS + ("publisher", "alt_names", "has_gaps",
+                                  "is_empty", "max_volume", "volumes_owned")
+
+class ListItems(IntEnum):
+    """
+    ListItems(IntEnum)
+
+    An enum tracking the column numbers for each series property, when
+    selecting LIST_COLUMNS from the Series table.
+    """
+    ROWID = 0
+    NAME = 1
+    AUTHOR = 2
+    IS_COMPLETED = 3
+    NEXT_VOLUME = 4
+    PUBLISHER = 5
+    ALT_NAMES = 6
+    HAS_GAPS = 7
+    IS_EMPTY = 8
+    MAX_VOLUME = 9
+    VOL_OWNED = 10
+
+
+class WriteResult(IntEnum):
+    """
+    WriteResult(IntEnum)
+
+    The result of writing a series to the database. NAME_CONFLICT is
+    zero, so results can be tested for success like a boolean.
+    """
+    NAME_CONFLICT = 0
+    WRITTEN = 1
+    UNCHANGED = 2
 
 
 class Series():
@@ -34,7 +121,15 @@ class Series():
 
     A single manga series. Contains the name of the series, the number of
     volumes currently owned, whether the series is completed
+
+    Values derived from the volumes owned (the volume set and its
+    readable string) are only computed when used, then kept until the
+    volumes owned change.
     """
+    __slots__ = ("name", "_volumes_owned", "is_completed", "_next_volume",
+                 "publisher", "author", "alt_names", "rowid", "_vol_set",
+                 "_volumes_owned_readable", "_changed")
+
     def __init__(self, **kwargs):
         """
         __init__(self, args)
@@ -42,8 +137,8 @@ class Series():
 
         Keyword Arguments:
         name (String) -- Name of series
-        volumes_owned (String) -- Comma-separated values representing
-            volumes in collection
+        volumes_owned (Bytes) -- Packed bitset of volumes in collection,
+            as returned by generate_volumes_owned()
         is_completed (Int) -- whether all volumes owned or not
         next_volume -- Lowest-numbered volume not currently owned; set by
             calculate_next_volume() (default -1)
@@ -57,125 +152,142 @@ class Series():
         compact_list -- A boolean deciding whether __str__ should return
             a single line or multiple lines.
         """
-        valid_keys = ["name", "volumes_owned", "is_completed",
-                      "next_volume", "publisher", "author",
-                      "alt_names", "rowid"]
-
-        for key in valid_keys:
-            self.__dict__[key] = kwargs.get(key)
-
-        # self.name = str(name)
-        # self.volumes_owned = str(volumes_owned)
-        # self.is_completed = is_completed
-        # self.next_volume = next_volume
-        # self.publisher = str(publisher)
-        # self.author = str(author)
-        # self.alt_names = str(alt_names)
-        # self.rowid = rowid
-
-        self.vol_arr = [int(x) for x in self.volumes_owned.split(',')]
-        self.volumes_owned_readable = ""
-        self.get_volumes_owned()
-        if self.next_volume == -1 or not self.next_volume:
-            self.next_volume = self.calculate_next_volume()
+        self._changed = set()
+        self.name = kwargs.get("name")
+        self.volumes_owned = kwargs.get("volumes_owned")
+        self.is_completed = kwargs.get("is_completed")
+        self.next_volume = kwargs.get("next_volume")
+        self.publisher = kwargs.get("publisher")
+        self.author = kwargs.get("author")
+        self.alt_names = kwargs.get("alt_names")
+        self.rowid = kwargs.get("rowid")
+        self._changed.clear()
+
+    def __setattr__(self, key, value):
+        """
+        __setattr__(self, key, value)
+        Sets an attribute, recording which database fields change so
+        update_database_entry() only writes those fields
+        """
+        if key in SERIES_FIELDS:
+            # compare against the stored value, so lazy values such as
+            # next_volume aren't computed just to be replaced
+            if getattr(self, STORED_FIELDS.get(key, key), None) != value:
+                self._changed.add(key)
+        object.__setattr__(self, key, value)
+
+    @property
+    def volumes_owned(self):
+        """Packed bitset of volumes in collection"""
+        return self._volumes_owned
+
+    @volumes_owned.setter
+    def volumes_owned(self, volumes_owned):
+        # The volume set and strings derived from it are computed again
+        # the next time they are used
+        self._volumes_owned = volumes_owned
+        self._vol_set = None
+        self._volumes_owned_readable = None
+
+    @property
+    def vol_set(self):
+        """VolumeSet of volumes in collection, unpacked when first used"""
+        if self._vol_set is None:
+            self._vol_set = VolumeSet.from_bytes(self._volumes_owned)
+        return self._vol_set
+
+    @property
+    def volumes_owned_readable(self):
+        """Volumes in collection in human-readable format"""
+        return self.get_volumes_owned()
+
+    @property
+    def next_volume(self):
+        """
+        Lowest-numbered volume not currently owned; calculated from the
+        volumes owned when first used if it was not given (or -1)
+        """
+        if self._next_volume == -1 or not self._next_volume:
+            self._next_volume = self.calculate_next_volume()
+        return self._next_volume
+
+    @next_volume.setter
+    def next_volume(self, next_volume):
+        self._next_volume = next_volume
 
     def get_volumes_owned(self):
         """
         get_volumes_owned()
-        Inverse of generate function; convert integers into human-readable
-        format (same as original input format)
+        Inverse of generate function; convert volume set into
+        human-readable format (same as original input format)
         """
-        if self.volumes_owned_readable == "":
-            index = 0
-            first = -1
-            last = -1
-            none_owned = 1
-
-            for num in self.vol_arr:
-                if num == 0:  # no volumes in set of 32, no need to check bits
-                    if first != -1:
-                        last = index * 32
-                        self.volumes_owned_readable += (
-                            "{0}, ".format(first) if first == last
-                            else "{0}-{1}, ".format(first, last))
-                        first = -1
-                    index += 1
-                    continue
-
-                none_owned = 0
-                for i in range(0, 32):
-                    # assuming sequential
-                    if first == -1 and num & (1 << i) != 0:
-                        first = index * 32 + i + 1
-
-                    if first != -1 and num & (1 << i) == 0:
-                        last = index * 32 + i
-                        self.volumes_owned_readable += (
-                            "{0}, ".format(first) if first == last
-                            else "{0}-{1}, ".format(first, last))
-                        first = -1
-                index += 1
-
-            if first != -1:  # last set of volumes reaches volume limit
-                last = Config().volume_limit
-                self.volumes_owned_readable += (
-                    "{0}, ".format(first) if first == last
-                    else "{0}-{1}, ".format(first, last))
-                first = -1
-            if none_owned:
-                self.volumes_owned_readable = "None"
-            else:
-                self.volumes_owned_readable = self.volumes_owned_readable[:-2]
-        return self.volumes_owned_readable
+        if self._volumes_owned_readable is None:
+            self._volumes_owned_readable = str(self.vol_set)
+        return self._volumes_owned_readable
 
     def get_is_completed(self):
         """Returns whether all volumes for series are in collection"""
         return "Yes" if self.is_completed == 1 else "No"
 
-    def get_volumes_owned_binary(self):
-        """Converts vol_arr to a single binary string listing all volumes"""
-        vol_str = ""
-        for val in self.vol_arr:
-            vol_str += "{0:032b}".format(val)[::-1]
-        return vol_str
+    def derived_columns(self):
+        """
+        derived_columns()
+        Returns the values of DERIVED_FIELDS for the volumes owned
+        """
+        count = self.vol_set.count()
+        return (count, int(self.vol_set.has_gaps()), int(count == 0),
+                self.vol_set.max_volume())
 
     def calculate_next_volume(self):
         """Calculate lowest volume not in collection"""
-        index = 0
-        for num in self.vol_arr:
-            for i in range(0, 32):
-                if num & (1 << i) == 0:
-                    return index * 32 + i + 1
-            index += 1
-        print("Next volume for %s would exceed volume limit" % self.name)
-        return index * 32 + 1
+        next_volume = self.vol_set.next_volume()
+        if next_volume > Config().volume_limit:
+            print("Next volume for %s would exceed volume limit" % self.name)
+        return next_volume
+
+    def set_volumes(self, vol_set):
+        """
+        set_volumes()
+        Replaces the set of volumes owned and updates dependent fields
+        (packed volumes, readable volumes and next volume)
+        """
+        self.volumes_owned = vol_set.to_bytes()
+        self._vol_set = vol_set
+        self.next_volume = self.calculate_next_volume()
 
     def add_series_to_database(self, data_mgr):
         """
         add_series_to_database()
         Takes a series and adds it to the database if the database
-        contains no entries with the same name as series.
+        contains no entries with the same name as series (ignoring case),
+        and sets rowid to the row of the new series.
 
-        Returns True on success, False on failure.
+        Returns WriteResult.WRITTEN on success, or
+        WriteResult.NAME_CONFLICT if the name is already used.
         """
-        cur = data_mgr.query("SELECT name FROM Series WHERE name='{0}'"
-                             .format(self.name.replace("'", "''")))
-        entries = cur.fetchall()
-
-        if not entries:
-            data_mgr.query("INSERT INTO Series VALUES("
-                           "'{0}','{1}',{2},{3},'{4}','{5}','{6}')"
-                           .format(
-                               self.name.replace("'", "''").strip(),
-                               self.volumes_owned,
-                               self.is_completed,
-                               self.next_volume,
-                               self.publisher.replace("'", "''").strip(),
-                               self.author.replace("'", "''").strip(),
-                               self.alt_names.replace("'", "''").strip()))
-            return True
-
-        return False
+        # The name constraint decides in the same statement whether the
+        # series can be added, so no other writer can add it in between
+        with data_mgr.transaction():
+            cur = data_mgr.execute("INSERT INTO Series(%s) VALUES(%s) "
+                                   "ON CONFLICT(name) DO NOTHING"
+                                   % (", ".join(SERIES_FIELDS
+                                                + DERIVED_FIELDS),
+                                      ",".join("?" * (len(SERIES_FIELDS)
+                                                      + len(DERIVED_FIELDS)))),
+                                   (self.name.strip(),
+                                    self.volumes_owned,
+                                    self.is_completed,
+                                    self.next_volume,
+                                    self.publisher.strip(),
+                                    self.author.strip(),
+                                    self.alt_names.strip())
+                                   + self.derived_columns())
+            if cur.rowcount == 0:
+                return WriteResult.NAME_CONFLICT
+            self.rowid = cur.lastrowid
+
+        self._changed.clear()
+        return WriteResult.WRITTEN
 
     def edit(self, data_mgr):
         """
@@ -204,12 +316,7 @@ class Series():
                     print("'{0}' is a reserved word. Name not changed."
                           .format(series_name))
                 else:
-                    cur = data_mgr.query("Select name FROM Series WHERE "
-                                         "name = '{0}'"
-                                         .format(series_name
-                                                 .replace("'", "''")))
-                    row = cur.fetchall()
-                    if row:
+                    if name_in_use(data_mgr, series_name, self.rowid):
                         print("New name already present in database,"
                               "not changed")
                     else:
@@ -268,8 +375,11 @@ class Series():
 
         save_series = input("Save changes? (y/N): ").strip()
         if save_series in ('y', 'Y'):
-            self.update_database_entry(data_mgr)
-            print("Series updated!")
+            if self.update_database_entry(data_mgr):
+                print("Series updated!")
+            else:
+                print("New name already present in database, "
+                      "series not updated.")
 
         return False
 
@@ -281,17 +391,7 @@ class Series():
         series entry.
 
         """
-        volumes_to_add = generate_volumes_owned(volumes_to_add)
-        vol_arr_to_add = [int(x) for x in
-                          volumes_to_add.split(",")]
-        self.vol_arr = [x | y for x, y in
-                        zip(vol_arr_to_add, self.vol_arr)]
-
-        # update related fields
-        self.next_volume = self.calculate_next_volume()
-        self.volumes_owned_readable = ""
-        self.volumes_owned = generate_volumes_owned(
-            self.get_volumes_owned())
+        self.set_volumes(self.vol_set | parse_volumes(volumes_to_add))
 
     def remove_volumes(self, volumes_to_remove):
         """Standalone function for removing volumes from a series.
@@ -301,17 +401,7 @@ class Series():
         series
 
         """
-        volumes_to_remove = generate_volumes_owned(volumes_to_remove)
-        vol_arr_to_remove = [int(x) for x in
-                             volumes_to_remove.split(",")]
-        self.vol_arr = [~x & y for x, y in
-                        zip(vol_arr_to_remove, self.vol_arr)]
-
-        # update related fields
-        self.next_volume = self.calculate_next_volume()
-        self.volumes_owned_readable = ""
-        self.volumes_owned = generate_volumes_owned(
-            self.get_volumes_owned())
+        self.set_volumes(self.vol_set - parse_volumes(volumes_to_remove))
 
     def edit_volumes(self):
         """
@@ -329,82 +419,71 @@ class Series():
             volumes_to_add = input(
                 "Enter volumes to add (ex. 1, 3-5): ")
 
-            volumes_to_add = generate_volumes_owned(volumes_to_add)
-            vol_arr_to_add = [int(x) for x in
-                              volumes_to_add.split(",")]
-            self.vol_arr = [x | y for x, y in
-                            zip(vol_arr_to_add, self.vol_arr)]
-
-            # update related fields
-            self.next_volume = self.calculate_next_volume()
-            self.volumes_owned_readable = ""
-            self.volumes_owned = generate_volumes_owned(
-                self.get_volumes_owned())
+            self.add_volumes(volumes_to_add)
 
         # Remove Volumes
         if change_volumes in ('r', 'R'):
             volumes_to_rmv = input(
                 "Enter volumes to remove (ex. 1, 3-5): ")
 
-            volumes_to_rmv = generate_volumes_owned(volumes_to_rmv)
-            vol_arr_to_remove = [int(x) for x in
-                                 volumes_to_rmv.split(",")]
-            self.vol_arr = [~x & y for x, y in
-                            zip(vol_arr_to_remove, self.vol_arr)]
+            self.remove_volumes(volumes_to_rmv)
 
-            print(self.vol_arr)
-            if all(not x for x in self.vol_arr):
+            if not self.vol_set:
                 user_input = input("No volumes owned for series. "
                                    "Remove from database? (y/N): ").strip()
                 if user_input in ('y', 'Y'):
                     return True
 
-            # update related fields
-            self.next_volume = self.calculate_next_volume()
-            self.volumes_owned_readable = ""
-            self.volumes_owned = generate_volumes_owned(
-                self.get_volumes_owned())
-
         return False
 
     def update_database_entry(self, data_mgr):
         """
         update_database_entry()
-        Updates all fields in database for series based on unique identifier;
-        adds series to database if not currently in database
+        Updates the fields changed since the series was loaded in the
+        database entry for the series, based on unique identifier; adds
+        series to database if not currently in database
+
+        Returns WriteResult.WRITTEN, WriteResult.UNCHANGED if there was
+        nothing to write, or WriteResult.NAME_CONFLICT if the new name
+        is already used by another series.
         """
         if self.rowid is None:
-            self.add_series_to_database(data_mgr)
-            return
-
-        data_mgr.query("UPDATE Series SET "
-                       "name = '{0}', "
-                       "volumes_owned = '{1}', "
-                       "is_completed = {2}, "
-                       "next_volume = {3}, "
-                       "publisher = '{4}', "
-                       "author = '{5}', "
-                       "alt_names = '{6}' WHERE ROWID = {7}".format(
-                           self.name.replace("'", "''").strip(),
-                           self.volumes_owned,
-                           self.is_completed,
-                           self.next_volume,
-                           self.publisher.replace("'", "''").strip(),
-                           self.author.replace("'", "''").strip(),
-                           self.alt_names.replace("'", "''").strip(),
-                           self.rowid))
-
-        return
+            return self.add_series_to_database(data_mgr)
+
+        # Only fields changed since the series was loaded are written;
+        # unchanged series are not written at all
+        changed = [field for field in SERIES_FIELDS if field in self._changed]
+        if not changed:
+            return WriteResult.UNCHANGED
+
+        values = []
+        for field in changed:
+            value = getattr(self, field)
+            values.append(value.strip() if field in TEXT_FIELDS else value)
+        if "volumes_owned" in self._changed:
+            changed += DERIVED_FIELDS
+            values.extend(self.derived_columns())
+
+        try:
+            with data_mgr.transaction():
+                data_mgr.execute("UPDATE Series SET %s WHERE ROWID = ?"
+                                 % ", ".join(field + " = ?"
+                                             for field in changed),
+                                 values + [self.rowid])
+        except lite.IntegrityError:
+            # only name has a constraint which an update can break
+            return WriteResult.NAME_CONFLICT
+        self._changed.clear()
+
+        return WriteResult.WRITTEN
 
     def compact_string(self):
         """
         compact_string()
         Returns a one-line string representation of the Series object
         """
-        result = (self.name + " by " + self.author + " (" +
-                  ("Completed)" if self.is_completed
-                   else "Next Volume: %d)" % self.next_volume))
-        return result
+        return format_compact(self.name, self.author, self.is_completed,
+                              self.next_volume)
 
     def full_string(self):
         """
@@ -437,83 +516,74 @@ def init_database(data_mgr, new_db_needed=True):
     Initializes a DatabaseManager() object for use
     storing data for Series objects
 
+    Creates the Series table if it does not exist, then applies any
+    pending schema migrations (see migrations.py). Existing databases
+    are backed up before they are migrated.
+
     Passed as argument to DatabaseManager() constructor
     """
-    data_mgr.query("SELECT name FROM sqlite_master "
-                   "WHERE type='table' AND name='Series'")
-
-    if data_mgr.cur.fetchone() is None:
-        data_mgr.query("CREATE TABLE Series(name TEXT, volumes_owned TEXT, "
-                       "is_completed INT, next_volume INT, publisher TEXT, "
-                       "author TEXT, alt_names TEXT, PRIMARY KEY(name))")
-        if new_db_needed:
+    cur = data_mgr.execute("SELECT name FROM sqlite_master "
+                           "WHERE type = 'table' AND name = 'Series'")
+    new_database = cur.fetchone() is None
+
+    if new_database:
+        data_mgr.execute(ORIGINAL_SERIES_SCHEMA)
+    data_mgr.migrate(SERIES_MIGRATIONS, backup=not new_database)
+
+    if new_database and new_db_needed:
+        # Each series is committed as soon as it is entered; no
+        # transaction is held open while waiting for input
+        next_series = input_series(data_mgr)
+        while next_series is not None:
+            if next_series.add_series_to_database(data_mgr):
+                print("----------------------------------------")
+                print(next_series)
+                print("----------------------------------------")
+            else:
+                print("Failed to add series! (name conflict)")
             next_series = input_series(data_mgr)
-            while next_series is not None:
-                if next_series.add_series_to_database(data_mgr):
-                    print("----------------------------------------")
-                    print(next_series)
-                    print("----------------------------------------")
-                else:
-                    print("Failed to add series! (name conflict)")
-                next_series = input_series(data_mgr)
 
 
-def generate_volumes_owned(vol_list):
-    """Converts the given volume list into a four-integer string representation.
+def name_in_use(data_mgr, name, rowid=None):
+    """
+    name_in_use()
+    Returns whether a series other than the one at rowid has the given
+    name, ignoring case and surrounding whitespace. Used to warn about
+    a name before any other input; writes still check for conflicts
+    themselves, as another writer could take the name in between.
+    """
+    return data_mgr.execute("SELECT EXISTS(SELECT 1 FROM Series WHERE "
+                            "name = ? AND rowid IS NOT ?)",
+                            (name.strip(), rowid)).fetchone()[0] == 1
+
+
+def parse_volumes(vol_list):
+    """Converts the given volume list into a VolumeSet.
 
-    Takes a string of numbers in a comma-separated list (ex. "1, 3-5, 7"),
-    stores them bitwise in 32-bit integers, then concatenates
-    bitwise representations of them in a string and returns the
-    result. Returns '0,0,0,0' by default if input is invalid or empty.
+    Takes a string of numbers in a comma-separated list (ex. "1, 3-5, 7")
+    and returns the set of volumes it lists, up to the volume limit.
+    Returns an empty set if input is invalid or empty.
 
     """
     # Check that input is valid
     pattern = r"^\d+(-\d+)?(,\s*\d+(-\d+)?)*\s*$"
     if not regexp(pattern, vol_list):
         print("Using default (empty series)")
-        return '0,0,0,0'
-
-    volume_limit = Config().volume_limit
-    arr_length = int(math.ceil(volume_limit / 32))
-    vol_arr = [0 for x in range(0, arr_length)]
-    entered_values = [x.strip() for x in vol_list.split(',')]
-
-    for num in entered_values:
-        if num in ('', 'None'):  # empty string, no volumes
-            continue
-        if '-' in num:  # two integers separated by dash
-            # should always have 2 integers
-            nums = [int(k) for k in num.split('-')]
-            if nums[0] < 1:
-                print("Start volume must be greater than zero; "
-                      "token %s ignored" % num)
-                continue
-            if nums[1] > volume_limit:
-                print("End volume too high; consider raising volume limit "
-                      "(currently {0})".format(volume_limit))
-                nums[1] = 128
-            for i in range(nums[0]-1, nums[1]):
-                vol_arr[i // 32] |= 1 << (i % 32)
-        else:  # single integer
-            try:
-                num = int(num) - 1
-            except ValueError:
-                print("Invalid token: {0}".format(num))
-                continue
-            if num < 0:
-                print("Token {0} ignored; volume number must be "
-                      "greater than zero".format(num))
-                continue
-            if num >= volume_limit:
-                print("Token {0} ignored; volume number must be lower "
-                      "than volume limit (currently {1})"
-                      .format(num, volume_limit))
-                continue
-            vol_arr[num // 32] |= 1 << (num % 32)
-    result = ""
-    for num in vol_arr:
-        result += format(num) + ','
-    return result[:-1]
+        return VolumeSet()
+
+    return VolumeSet.parse(vol_list, Config().volume_limit)
+
+
+def generate_volumes_owned(vol_list):
+    """Converts the given volume list into the packed BLOB representation.
+
+    Takes a string of numbers in a comma-separated list (ex. "1, 3-5, 7")
+    and returns the bytes stored in the volumes_owned column (see
+    VolumeSet.to_bytes()). Returns an empty value (no volumes) if input
+    is invalid or empty.
+
+    """
+    return parse_volumes(vol_list).to_bytes()
 
 
 def input_series(data_mgr):
@@ -534,15 +604,9 @@ def input_series(data_mgr):
             print("'{0}' is a reserved word and cannot be used."
                   .format(series_name))
             return None
-        # try:
-        cur = data_mgr.query("Select name FROM Series WHERE name = '{0}'"
-                             .format(series_name.replace("'", "''")))
-        row = cur.fetchall()
-        if row:
+        if name_in_use(data_mgr, series_name):
             print("Name already in database!")
             return None
-        # except:
-        #     print("Database query failed, continuing...")
         volumes_raw = input("Enter volumes owned (if any) (ex. 1, 3-5): ")
         volumes_owned = generate_volumes_owned(volumes_raw)
 
@@ -586,13 +650,7 @@ class EditSeries():
                   .format(name))
             return (2, "{0} is a reserved word.".format(name))
         else:
-            if data_mgr:
-                cur = data_mgr.query("Select name FROM Series WHERE "
-                                     "name = '{0}'"
-                                     .format(name
-                                             .replace("'", "''")))
-                row = cur.fetchall()
-            if data_mgr and row:
+            if data_mgr and name_in_use(data_mgr, name, series.rowid):
                 print("New name already present in database,"
                       "not changed.")
                 return (3, "Name already present in database.")
@@ -602,15 +660,7 @@ class EditSeries():
                 return (0, "Name changed to \"{0}\".".format(series.name))
 
     def volumes(self, series, vol_str):
-        volumes_to_add = generate_volumes_owned(vol_str)
-        series.vol_arr = [int(x) for x in
-                          volumes_to_add.split(",")]
-
-        # update related fields
-        series.next_volume = series.calculate_next_volume()
-        series.volumes_owned_readable = ""
-        series.get_volumes_owned()
-        series.volumes_owned = generate_volumes_owned(self.get_volumes_owned())
+        series.set_volumes(parse_volumes(vol_str))
         return (0, "Volumes owned set to %s." % vol_str)
 
     def author(self, series, author):
@@ -643,3 +693,77 @@ class EditSeries():
             series.is_completed = 0
             return (0, "Series marked as incomplete.")
         return (1, "Invalid value for completion status.")
+
+
+def format_compact(name, author, is_completed, next_volume):
+    """
+    format_compact()
+    Returns the one-line representation of a series used by
+    Series.compact_string()
+    """
+    return (name + " by " + author + " (" +
+            ("Completed)" if is_completed
+             else "Next Volume: %d)" % next_volume))
+
+
+def compact_entry_string(entry):
+    """
+    compact_entry_string()
+    Returns the compact_string() of the series in a row selected using
+    COMPACT_COLUMNS, without building a Series from the row
+    """
+    return format_compact(str(entry[CompactItems.NAME]),
+                          str(entry[CompactItems.AUTHOR]),
+                          entry[CompactItems.IS_COMPLETED],
+                          entry[CompactItems.NEXT_VOLUME])
+
+
+def list_entry_to_series(entry):
+    """
+    list_entry_to_series()
+    Returns the series in a row selected using LIST_COLUMNS, which
+    holds every column shown for a series
+    """
+    return Series(name=str(entry[ListItems.NAME]),
+                  volumes_owned=entry[ListItems.VOL_OWNED],
+                  is_completed=entry[ListItems.IS_COMPLETED],
+                  next_volume=entry[ListItems.NEXT_VOLUME],
+                  publisher=str(entry[ListItems.PUBLISHER]),
+                  author=str(entry[ListItems.AUTHOR]),
+                  alt_names=str(entry[ListItems.ALT_NAMES]),
+                  rowid=entry[ListItems.ROWID])
+
+
+def sql_volume_count(volumes_owned):
+    """SQL function VOLUME_COUNT(volumes_owned): number of volumes owned"""
+    return VolumeSet.from_bytes(volumes_owned).count()
+
+
+def sql_volume_has_gaps(volumes_owned):
+    """SQL function VOLUME_HAS_GAPS(volumes_owned): 1 if set has gaps"""
+    return int(VolumeSet.from_bytes(volumes_owned).has_gaps())
+
+
+def sql_volume_max(volumes_owned):
+    """SQL function VOLUME_MAX(volumes_owned): highest volume owned"""
+    return VolumeSet.from_bytes(volumes_owned).max_volume()
+
+
+def sql_volume_next(volumes_owned):
+    """SQL function VOLUME_NEXT(volumes_owned): lowest volume not owned"""
+    return VolumeSet.from_bytes(volumes_owned).next_volume()
+
+
+def sql_volume_owns(volumes_owned, first, last):
+    """SQL function VOLUME_OWNS(volumes_owned, first, last): 1 if all of
+    volumes first to last are owned"""
+    wanted = VolumeSet.from_range(first, last)
+    return int(VolumeSet.from_bytes(volumes_owned) & wanted == wanted)
+
+
+# Used by migrations filling in the derived columns, and by searches
+register_function("VOLUME_COUNT", 1, sql_volume_count)
+register_function("VOLUME_HAS_GAPS", 1, sql_volume_has_gaps)
+register_function("VOLUME_MAX", 1, sql_volume_max)
+register_function("VOLUME_NEXT", 1, sql_volume_next)
+register_function("VOLUME_OWNS", 3, sql_volume_owns)
@@ -0,0 +1,280 @@
+""" seriesquery.py
+Structured search queries for the Series table
+
+A query is a list of words and field:value terms, for example
+'one piece author:oda completed:no gaps:yes'. Free words must appear
+together as a phrase in any text column, the last word matching as a
+prefix; the other terms are:
+
+    name:, author:, publisher:, alt:   words in that column only
+    completed:yes/no                   series is (not) completed
+    gaps:yes/no                        owned volumes do (not) have gaps
+    owns:N, owns:N-M                   owns volume N, or volumes N to M
+    owns:none, owns:any                owns no volumes, or at least one
+
+Values containing spaces can be quoted (author:"eiichiro oda"). Every
+term is compiled into one parameterized query, using the full-text
+index for text and the indexed derived columns for everything else,
+or into a function testing rows already loaded in memory.
+
+Copyright 2020 by Nicholas Bishop
+"""
+
+import re
+import unicodedata
+from volumeset import VolumeSet
+
+# Fields matching words in a text column
+TEXT_FIELDS = {"name": "name", "title": "name", "author": "author",
+               "publisher": "publisher", "alt": "alt_names",
+               "alt_names": "alt_names"}
+
+# Fields matching a yes/no flag column
+FLAG_FIELDS = {"completed": "is_completed", "gaps": "has_gaps"}
+
+FLAG_VALUES = {"yes": 1, "y": 1, "true": 1, "1": 1,
+               "no": 0, "n": 0, "false": 0, "0": 0}
+
+# field:value or field:"quoted value" if field is known, else a word
+# or a quoted phrase; 'Re:Zero' stays a word as 're' is not a field
+TERM_PATTERN = re.compile(r'(?:(%s):)?("[^"]*"?|\S+)' % "|".join(
+    sorted(list(TEXT_FIELDS) + list(FLAG_FIELDS) + ["owns"],
+           key=len, reverse=True)), re.IGNORECASE)
+
+# Separators of the unicode61 tokenizer used by the full-text index
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+# Text columns searched by free words
+SEARCH_COLUMNS = ("name", "publisher", "author", "alt_names")
+
+
+class SearchSyntaxError(ValueError):
+    """Raised for a search term which can't be compiled"""
+
+
+def parse_search(search_text):
+    """
+    parse_search(search_text)
+    Splits search_text into its text matches and its filters, returned
+    as (matches, filters). Matches are (column, text) pairs, with a
+    column of None for free words. Filters are (column, value) pairs:
+    flag columns with a value of 0 or 1, and 'owns' with a value from
+    parse_owns().
+    """
+    phrase = []
+    matches = []
+    filters = []
+
+    for field, value in TERM_PATTERN.findall(search_text):
+        field = field.lower()
+        value = value.strip('"')
+        if not field:
+            phrase.append(value)
+        elif field in TEXT_FIELDS:
+            if not WORD_PATTERN.search(value):
+                raise SearchSyntaxError("%s: needs a value" % field)
+            matches.append((TEXT_FIELDS[field], value))
+        elif field in FLAG_FIELDS:
+            if value.lower() not in FLAG_VALUES:
+                raise SearchSyntaxError("%s: must be yes or no, not '%s'"
+                                        % (field, value))
+            filters.append((FLAG_FIELDS[field], FLAG_VALUES[value.lower()]))
+        else:
+            filters.append(("owns", parse_owns(value)))
+
+    if WORD_PATTERN.search(" ".join(phrase)):
+        matches.insert(0, (None, " ".join(phrase)))
+    return (matches, filters)
+
+
+def compile_search_source(search_text, use_fts=True):
+    """
+    compile_search_source(search_text, use_fts)
+    Compiles search_text into the parts of a query on Series, returned
+    as (table, condition, params, sort_keys): the FROM clause, the
+    WHERE condition ('' for none), the params of both in order, and the
+    sort keys ordering results by relevance (bm25) and then name. The
+    last sort key is rowid, so the parts can be given to a
+    KeysetPaginator. Series columns must be selected as Series.column.
+
+    Text terms use the Series_fts index if use_fts is True and LIKE
+    otherwise.
+    """
+    conditions = []
+    params = []
+    matches, filters = parse_search(search_text)
+
+    for column, value in filters:
+        if column == "owns":
+            condition, owns_params = compile_owns(value)
+            conditions.append(condition)
+            params.extend(owns_params)
+        else:
+            conditions.append("%s = ?" % column)
+            params.append(value)
+
+    table = "Series"
+    sort_keys = ["Series.name", "Series.rowid"]
+    if any(column == "owns" and isinstance(value, tuple)
+           for column, value in filters):
+        # Without '+', SQLite reads the whole table in name order rather
+        # than finding the owners through series_max_volume and sorting
+        sort_keys[0] = "+Series.name"
+    if matches and use_fts:
+        # Column filters and phrase prefixes in FTS5 query syntax; only
+        # word characters are quoted in, so input can't inject syntax
+        table = ("Series JOIN "
+                 "(SELECT rowid AS match_rowid, rank AS match_rank "
+                 "FROM Series_fts WHERE Series_fts MATCH ?) "
+                 "ON Series.rowid = match_rowid")
+        params.insert(0, " AND ".join(
+            ('"%s"*' if column is None else column + ' : "%s"*')
+            % " ".join(WORD_PATTERN.findall(text))
+            for column, text in matches))
+        sort_keys.insert(0, "match_rank")
+    elif matches:
+        like_conditions = []
+        like_params = []
+        for column, text in matches:
+            columns = SEARCH_COLUMNS if column is None else (column,)
+            like_conditions.append("(%s)" % " OR ".join(
+                "%s LIKE ? ESCAPE '\\'" % col for col in columns))
+            # % and _ in the text match literally
+            like_params.extend(["%" + re.sub(r"([\\%_])", r"\\\1", text)
+                                + "%"] * len(columns))
+        conditions = like_conditions + conditions
+        params = like_params + params
+
+    return (table, " AND ".join(conditions), params, tuple(sort_keys))
+
+
+def parse_owns(value):
+    """
+    parse_owns(value)
+    Returns the value of an owns: term, either 'none', 'any' or a
+    (first, last) range of volumes
+    """
+    value = value.lower()
+    if value in ("none", "any"):
+        return value
+
+    match = re.fullmatch(r"(\d+)(?:-(\d+))?", value)
+    if not match or int(match.group(1)) < 1:
+        raise SearchSyntaxError("owns: must be none, any, a volume "
+                                "or a range of volumes, not '%s'" % value)
+    first = int(match.group(1))
+    last = int(match.group(2) or first)
+    if last < first:
+        raise SearchSyntaxError("owns: range %s ends before it starts"
+                                % value)
+    return (first, last)
+
+
+def compile_owns(value):
+    """
+    compile_owns(value)
+    Returns the (condition, params) for a value from parse_owns()
+    """
+    if value == "none":
+        return ("is_empty = ?", [1])
+    if value == "any":
+        return ("is_empty = ?", [0])
+
+    first, last = value
+    # max_volume rules out most series before the set is unpacked
+    return ("max_volume >= ? AND VOLUME_OWNS(volumes_owned, ?, ?)",
+            [last, first, last])
+
+
+def compile_filter(search_text, columns):
+    """
+    compile_filter(search_text, columns)
+    Compiles search_text into a function matches(entry, words=None)
+    returning whether a row matches, for filtering rows already in
+    memory instead of querying the database again. Rows hold the given
+    columns, which must include the text columns, is_completed,
+    has_gaps, is_empty, max_volume and volumes_owned. words is the
+    row's index_words(); pass it in when filtering the same rows
+    repeatedly, so their text is only folded once.
+
+    Text terms match the way the full-text index does: the words must
+    appear together in one column, ignoring case and accents, with the
+    last word matching as a prefix.
+    """
+    matches, filters = parse_search(search_text)
+    index = {column: i for i, column in enumerate(columns)}
+    # Cheap column tests run before text and volume tests
+    tests = []
+    slow_tests = []
+
+    for column, value in filters:
+        if value == "none":
+            column, value = "is_empty", 1
+        elif value == "any":
+            column, value = "is_empty", 0
+        if column == "owns":
+            slow_tests.append(owns_test(index["max_volume"],
+                                        index["volumes_owned"], *value))
+        else:
+            tests.append(equals_test(index[column], value))
+
+    for column, text in matches:
+        positions = ([SEARCH_COLUMNS.index(column)] if column
+                     else range(len(SEARCH_COLUMNS)))
+        slow_tests.append(phrase_test(positions, fold_words(text)))
+    tests.extend(slow_tests)
+
+    if not matches:
+        return lambda entry, words=None: all(test(entry, words)
+                                             for test in tests)
+
+    def test_all(entry, words=None):
+        if words is None:
+            words = index_words(entry, columns)
+        return all(test(entry, words) for test in tests)
+    return test_all
+
+
+def index_words(entry, columns):
+    """
+    index_words(entry, columns)
+    Returns the folded words of each of SEARCH_COLUMNS in a row holding
+    the given columns, each as one string with a space before every
+    word, which text terms of compile_filter() are matched against
+    """
+    return tuple(" " + " ".join(fold_words(entry[columns.index(column)]))
+                 for column in SEARCH_COLUMNS)
+
+
+def fold_words(text):
+    """
+    fold_words(text)
+    Returns the words of text the way the full-text index stores them:
+    case folded, without accents and split on non-word characters
+    """
+    text = unicodedata.normalize("NFKD", str(text).casefold())
+    return WORD_PATTERN.findall("".join(
+        char for char in text if not unicodedata.combining(char)))
+
+
+def phrase_test(positions, words):
+    """Returns a test for words being a phrase prefix in any of the
+    index_words() strings at positions"""
+    # Words hold no spaces, so ' w1 w2 w3' is found only where w1 and w2
+    # are whole words, followed by a word starting with w3
+    phrase = " " + " ".join(words)
+    return lambda entry, indexed: any(phrase in indexed[position]
+                                      for position in positions)
+
+
+def equals_test(position, value):
+    """Returns a test for the column of an entry at position being value"""
+    return lambda entry, indexed: entry[position] == value
+
+
+def owns_test(max_position, volumes_position, first, last):
+    """Returns a test for an entry owning every volume from first to last"""
+    wanted = VolumeSet.from_range(first, last)
+    return lambda entry, indexed: (
+        entry[max_position] >= last
+        and VolumeSet.from_bytes(entry[volumes_position]) & wanted == wanted)
@@ -29,7 +29,7 @@ class Ui_MainWindow(object):
         self.filter_button.setObjectName("filter_button")
         self.filter_series_container.addWidget(self.filter_button)
         self.left_column_container.addLayout(self.filter_series_container)
-        self.list_series = QtWidgets.QListWidget(self.centralwidget)
+        self.list_series = QtWidgets.QListView(self.centralwidget)
         self.list_series.setObjectName("list_series")
         self.left_column_container.addWidget(self.list_series)
         self.left_button_container = QtWidgets.QHBoxLayout()
@@ -0,0 +1,180 @@
+""" volumeset.py
+Set of owned volume numbers for a manga series
+
+Copyright 2020 by Nicholas Bishop
+"""
+
+
+class VolumeSet():
+    """
+    VolumeSet(object)
+
+    A set of volume numbers stored as the bits of a single integer;
+    bit i is set if volume i + 1 is in the set. Since Python integers
+    have no fixed width, a set can hold any number of volumes, and
+    queries such as the next missing volume are answered with a few
+    integer operations instead of a scan over every bit.
+    """
+    __slots__ = ("bits",)
+
+    def __init__(self, bits=0):
+        """
+        __init__(self, bits)
+        Create a volume set from its integer representation
+        (default 0, no volumes)
+        """
+        self.bits = bits
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Create a volume set from the BLOB returned by to_bytes()"""
+        return cls(int.from_bytes(data or b"", "little"))
+
+    def to_bytes(self):
+        """
+        to_bytes()
+        Returns the BLOB stored in the volumes_owned column.
+
+        Bit i of the little-endian result is set if volume i + 1 is
+        owned. Trailing zero bytes are dropped, so each set has exactly
+        one representation and an empty set is an empty BLOB.
+        """
+        return self.bits.to_bytes((self.bits.bit_length() + 7) // 8,
+                                  "little")
+
+    @classmethod
+    def from_range(cls, first, last):
+        """Create a volume set holding volumes first through last"""
+        if last < first:
+            return cls()
+        return cls(((1 << (last - first + 1)) - 1) << (first - 1))
+
+    @classmethod
+    def parse(cls, vol_list, volume_limit):
+        """
+        parse(vol_list, volume_limit)
+        Create a volume set from a comma-separated list of volumes and
+        ranges of volumes (ex. "1, 3-5, 7"). Tokens which are out of
+        range are reported and ignored, and ranges are clamped to
+        volume_limit.
+        """
+        result = cls()
+        entered_values = [x.strip() for x in vol_list.split(',')]
+
+        for num in entered_values:
+            if num in ('', 'None'):  # empty string, no volumes
+                continue
+            if '-' in num:  # two integers separated by dash
+                # should always have 2 integers
+                nums = [int(k) for k in num.split('-')]
+                if nums[0] < 1:
+                    print("Start volume must be greater than zero; "
+                          "token %s ignored" % num)
+                    continue
+                if nums[1] > volume_limit:
+                    print("End volume too high; consider raising volume "
+                          "limit (currently {0})".format(volume_limit))
+                    nums[1] = volume_limit
+                result |= cls.from_range(nums[0], nums[1])
+            else:  # single integer
+                try:
+                    num = int(num) - 1
+                except ValueError:
+                    print("Invalid token: {0}".format(num))
+                    continue
+                if num < 0:
+                    print("Token {0} ignored; volume number must be "
+                          "greater than zero".format(num))
+                    continue
+                if num >= volume_limit:
+                    print("Token {0} ignored; volume number must be lower "
+                          "than volume limit (currently {1})"
+                          .format(num, volume_limit))
+                    continue
+                result.bits |= 1 << num
+        return result
+
+    def next_volume(self):
+        """Returns the lowest volume number not in the set"""
+        # ~x & (x + 1) isolates the lowest unset bit
+        return (~self.bits & (self.bits + 1)).bit_length()
+
+    def max_volume(self):
+        """Returns the highest volume number in the set (0 if empty)"""
+        return self.bits.bit_length()
+
+    def count(self):
+        """Returns the number of volumes in the set"""
+        return bin(self.bits).count("1")
+
+    def has_gaps(self):
+        """
+        has_gaps()
+        Returns whether the set is not one continuous run of volumes
+        starting from volume 1
+        """
+        # x + 1 carries through the low run of ones; any bit left over
+        # in x & (x + 1) is owned above a missing volume
+        return self.bits & (self.bits + 1) != 0
+
+    def ranges(self):
+        """
+        ranges()
+        Yields (first, last) for each run of consecutive volumes in the
+        set, in ascending order. Jumps from run to run, so the cost
+        depends on the number of runs rather than the highest volume.
+        """
+        bits = self.bits
+        volume = 1
+        while bits:
+            # skip the unset bits below the next run
+            skip = (bits & -bits).bit_length() - 1
+            bits >>= skip
+            volume += skip
+
+            # measure the run of set bits
+            run = (~bits & (bits + 1)).bit_length() - 1
+            yield (volume, volume + run - 1)
+            bits >>= run
+            volume += run
+
+    def __str__(self):
+        """
+        __str__()
+        Returns the set in the human-readable input format
+        (ex. "1-3, 5, 7-9"), or "None" if the set is empty
+        """
+        if not self.bits:
+            return "None"
+        return ", ".join("{0}".format(first) if first == last
+                         else "{0}-{1}".format(first, last)
+                         for first, last in self.ranges())
+
+    def __repr__(self):
+        return "VolumeSet('{0}')".format(self)
+
+    def __contains__(self, volume):
+        return volume > 0 and bool(self.bits >> (volume - 1) & 1)
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __len__(self):
+        return self.count()
+
+    def __eq__(self, other):
+        if not isinstance(other, VolumeSet):
+            return NotImplemented
+        return self.bits == other.bits
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def __or__(self, other):
+        return VolumeSet(self.bits | other.bits)
+
+    def __and__(self, other):
+        return VolumeSet(self.bits & other.bits)
+
+    def __sub__(self, other):
+        return VolumeSet(self.bits & ~other.bits)
@@ -0,0 +1,59 @@
+""" test_config.py
+Test file for config.py
+
+Copyright 2020 by Nicholas Bishop
+"""
+
+import unittest
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "src"))
+
+from config import Config
+
+class ConfigReloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.temp_dir.name, "config.ini")
+        self.write("manga.db", 10)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, database_name, series_per_page):
+        with open(self.filename, 'w') as config_ini:
+            config_ini.write("[config]\n"
+                             "database_name = %s\n"
+                             "series_per_page = %d\n"
+                             % (database_name, series_per_page))
+
+    def testUnchangedFileIsNotReloaded(self):
+        config = Config(self.filename)
+        load_count = Config.load_count
+        self.assertIs(Config(self.filename), config)
+        self.assertEqual(Config.load_count, load_count)
+        self.assertEqual(config.series_per_page, 10)
+
+    def testChangedFileIsReloaded(self):
+        config = Config(self.filename)
+        load_count = Config.load_count
+        self.write("other.db", 25)
+        Config(self.filename)
+        self.assertEqual(Config.load_count, load_count + 1)
+        self.assertEqual(config.database_name, "other.db")
+        self.assertEqual(config.series_per_page, 25)
+
+    def testOwnWriteIsNotReloaded(self):
+        config = Config(self.filename)
+        load_count = Config.load_count
+        config.set_property("series_per_page", 5)
+        Config(self.filename)
+        self.assertEqual(Config.load_count, load_count)
+        self.assertEqual(config.series_per_page, 5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,667 @@
+""" test_database.py
+Test file for the Series table schema and queries
+
+Copyright 2020 by Nicholas Bishop
+"""
+
+import unittest
+import os
+import sys
+import tempfile
+import sqlite3
+import io
+from contextlib import redirect_stdout
+from unittest import mock
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "src"))
+
+from databasemanager import DatabaseManager
+from series import init_database
+from series import NOT_EMPTY
+from mangatracker import find_series
+from mangatracker import print_pages
+from seriesquery import compile_search_source
+from seriesquery import compile_filter
+from seriesquery import index_words
+from seriesquery import SearchSyntaxError
+from paginator import KeysetPaginator
+from series import COMPACT_COLUMNS
+from series import LIST_COLUMNS
+from series import list_entry_to_series
+from series import compact_entry_string
+from mangatracker import entry_to_series
+from series import Series
+from series import WriteResult
+from migrations import ORIGINAL_SERIES_SCHEMA
+from migrations import SERIES_MIGRATIONS
+from migrations import MigrationError
+from migrations import make_names_case_insensitive
+from volumeset import VolumeSet
+from series import name_in_use
+import databasemanager
+
+ORDERS = ("name", "author", "publisher", "alt_names")
+
+def search_query(search_text, use_fts=True,
+                 columns="Series.rowid, Series.*"):
+    """Returns (sql, params) of a query for every series matching
+    search_text, as fetched by find_series()"""
+    table, condition, params, sort_keys = compile_search_source(
+        search_text, use_fts)
+    return KeysetPaginator(None, table, sort_keys, condition, params,
+                           columns=columns).page_query()
+
+def add_series(data_mgr, name, volumes_owned=b"\x01", is_completed=0,
+               publisher="Unknown", author="Unknown", alt_names="Unknown"):
+    """Adds a series to the database the way the CLI and GUI do"""
+    series = Series(name=name, volumes_owned=volumes_owned,
+                    is_completed=is_completed,
+                    next_volume=VolumeSet.from_bytes(volumes_owned)
+                    .next_volume(),
+                    publisher=publisher, author=author, alt_names=alt_names)
+    series.add_series_to_database(data_mgr)
+    return series
+
+class QueryPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_mgr = DatabaseManager(":memory:", init_database, False)
+
+    def tearDown(self):
+        self.data_mgr.close()
+
+    def assertNoSort(self, sql, params=()):
+        """Fails if SQLite plans a temp B-tree sort for sql"""
+        plan = self.data_mgr.execute("EXPLAIN QUERY PLAN " + sql,
+                                     params).fetchall()
+        details = [row[-1] for row in plan]
+        self.assertFalse([d for d in details if "TEMP B-TREE" in d],
+                         "%s\n%s" % (sql, "\n".join(details)))
+
+    def testCliLists(self):
+        for order in ORDERS:
+            for condition in ("", "WHERE " + NOT_EMPTY):
+                self.assertNoSort("SELECT rowid, * FROM Series %s ORDER BY "
+                                  "%s_unknown, %s, rowid"
+                                  % (condition, order, order))
+        for condition in ("is_completed = ?", "is_completed = ? AND " +
+                          NOT_EMPTY, "is_empty = ?", "has_gaps = ?"):
+            self.assertNoSort("SELECT rowid, * FROM Series WHERE %s "
+                              "ORDER BY name" % condition, (1,))
+
+    def testOwnsUsesIndex(self):
+        # Text terms with the full-text index start from Series_fts
+        for term, use_fts in (("owns:3-4", True), ("series owns:3", False)):
+            sql, params = search_query(term, use_fts)
+            plan = self.data_mgr.execute("EXPLAIN QUERY PLAN " + sql,
+                                         params).fetchall()
+            self.assertIn("series_max_volume",
+                          " ".join(row[-1] for row in plan))
+
+    def testNoUnusedIndexes(self):
+        indexes = [row[0] for row in self.data_mgr.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' "
+            "AND sql IS NOT NULL ORDER BY name")]
+        self.assertEqual(indexes, sorted(
+            ["series_%s_list" % order for order in ORDERS]
+            + ["series_has_gaps", "series_is_completed", "series_is_empty",
+               "series_max_volume"]))
+
+    def testNewDatabaseDropsNothing(self):
+        data_mgr = DatabaseManager(":memory:", None)
+        self.addCleanup(data_mgr.close)
+        statements = []
+        data_mgr.con.set_trace_callback(statements.append)
+        init_database(data_mgr, False)
+        self.assertFalse([sql for sql in statements
+                          if sql.startswith("DROP INDEX")])
+
+class StreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_mgr = DatabaseManager(":memory:", init_database, False)
+        self.data_mgr.executemany(
+            "INSERT INTO Series(name, volumes_owned, is_completed, "
+            "publisher, author, alt_names) VALUES(?, x'01', 0, 'Unknown', "
+            "'Unknown', 'Unknown')", [("Series %d" % i,) for i in range(10)])
+
+    def tearDown(self):
+        self.data_mgr.close()
+
+    def testNestedStreams(self):
+        sql = "SELECT rowid FROM Series ORDER BY rowid"
+        pairs = [(outer[0], inner[0])
+                 for outer in self.data_mgr.stream(sql, batch_size=3)
+                 for inner in self.data_mgr.stream(sql, batch_size=4)]
+        self.assertEqual(len(pairs), 100)
+        self.assertEqual(pairs[-1], (10, 10))
+
+    def testStreamWithExecute(self):
+        names = []
+        for row in self.data_mgr.stream("SELECT rowid FROM Series",
+                                        batch_size=2):
+            names.append(self.data_mgr.execute(
+                "SELECT name FROM Series WHERE rowid = ?", row).fetchone()[0])
+        self.assertEqual(names, ["Series %d" % i for i in range(10)])
+
+    def testExecuteManyAtomic(self):
+        self.assertRaises(sqlite3.IntegrityError, self.data_mgr.executemany,
+                          "INSERT INTO Series(name, volumes_owned, "
+                          "is_completed) VALUES(?, x'01', 0)",
+                          [("Series 10",), ("Series 11",), ("Series 0",)])
+        self.assertFalse(self.data_mgr.in_transaction())
+        self.assertEqual(self.data_mgr.execute(
+            "SELECT COUNT(*) FROM Series").fetchone()[0], 10)
+
+class UpdateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_mgr = DatabaseManager(":memory:", init_database, False)
+        self.data_mgr.execute(
+            "INSERT INTO Series(name, volumes_owned, is_completed, "
+            "publisher, author, alt_names) VALUES('Series 1', x'07', 0, "
+            "'Publisher 1', 'Author 1', 'Unknown')")
+        self.statements = []
+        self.data_mgr.con.set_trace_callback(self.statements.append)
+
+    def tearDown(self):
+        self.data_mgr.close()
+
+    def load(self):
+        return entry_to_series(self.data_mgr.execute(
+            "SELECT rowid, * FROM Series").fetchone())
+
+    def updates(self):
+        return [sql for sql in self.statements if sql.startswith("UPDATE")]
+
+    def testUnchangedNotWritten(self):
+        series = self.load()
+        series.author = "Author 1"
+        series.update_database_entry(self.data_mgr)
+        self.assertEqual(self.updates(), [])
+
+    def testOnlyChangedFieldsWritten(self):
+        series = self.load()
+        series.is_completed = 1
+        series.update_database_entry(self.data_mgr)
+        self.assertEqual(self.updates(), ["UPDATE Series SET is_completed = 1 "
+                                          "WHERE ROWID = 1"])
+        self.assertEqual(self.load().is_completed, 1)
+
+        del self.statements[:]
+        series.update_database_entry(self.data_mgr)
+        self.assertEqual(self.updates(), [])
+
+        series.author = " Author 2 "
+        series.update_database_entry(self.data_mgr)
+        self.assertEqual(self.load().author, "Author 2")
+
+    def testDerivedColumns(self):
+        def derived():
+            return self.data_mgr.execute(
+                "SELECT volume_count, has_gaps, is_empty, max_volume "
+                "FROM Series WHERE name = 'Series 2'").fetchone()
+
+        series = add_series(self.data_mgr, "Series 2", b"\x05")
+        self.assertEqual(derived(), (2, 1, 0, 3))
+        series.volumes_owned = b""
+        series.update_database_entry(self.data_mgr)
+        self.assertEqual(derived(), (0, 0, 1, 0))
+
+        # Writes from connections without the VOLUME_* functions work
+        con = sqlite3.connect(":memory:")
+        self.addCleanup(con.close)
+        self.data_mgr.con.backup(con)
+        con.execute("UPDATE Series SET volumes_owned = x'03'")
+        con.execute("INSERT INTO Series(name, volumes_owned, is_completed) "
+                    "VALUES('Series 3', x'01', 0)")
+
+    def testNameConflicts(self):
+        series = Series(name=" SERIES 1 ", volumes_owned=b"", is_completed=0,
+                        next_volume=1, publisher="Unknown", author="Unknown",
+                        alt_names="")
+        self.assertEqual(series.add_series_to_database(self.data_mgr),
+                         WriteResult.NAME_CONFLICT)
+        self.assertIsNone(series.rowid)
+
+        series.name = "Series 2"
+        self.assertEqual(series.add_series_to_database(self.data_mgr),
+                         WriteResult.WRITTEN)
+        self.assertEqual(series.rowid, 2)
+        self.assertTrue(name_in_use(self.data_mgr, "series 2"))
+        self.assertFalse(name_in_use(self.data_mgr, "series 2", 2))
+
+        series.name = "series 1"
+        self.assertEqual(series.update_database_entry(self.data_mgr),
+                         WriteResult.NAME_CONFLICT)
+        self.assertFalse(self.data_mgr.in_transaction())
+        self.assertEqual(series.update_database_entry(self.data_mgr),
+                         WriteResult.NAME_CONFLICT)
+
+        series.name = "SERIES 2"
+        self.assertEqual(series.update_database_entry(self.data_mgr),
+                         WriteResult.WRITTEN)
+        self.assertEqual(series.update_database_entry(self.data_mgr),
+                         WriteResult.UNCHANGED)
+
+class MigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.database_name = os.path.join(self.temp_dir.name, "manga.db")
+        con = sqlite3.connect(self.database_name)
+        con.execute(ORIGINAL_SERIES_SCHEMA)
+        con.executemany("INSERT INTO Series(rowid, name, volumes_owned, "
+                        "is_completed, next_volume, publisher, author, "
+                        "alt_names) VALUES(?, ?, ?, 0, 1, 'Unknown', "
+                        "'Unknown', '')",
+                        [(5, "Series A", "95,128,0,0"),
+                         (9, "series b", "3,0,0,0"),
+                         (12, "Series D", "0,0,0,0"),
+                         (20, "Series C", "not volumes")])
+        con.commit()
+        con.close()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def upgrade(self):
+        """Opens the legacy database, migrating it to the latest version"""
+        data_mgr = DatabaseManager(self.database_name, init_database, False)
+        self.addCleanup(data_mgr.close)
+        return data_mgr
+
+    def testLegacyVolumes(self):
+        data_mgr = self.upgrade()
+        rows = data_mgr.execute("SELECT rowid, volumes_owned, next_volume, "
+                                "has_gaps, max_volume FROM Series "
+                                "ORDER BY rowid").fetchall()
+        self.assertEqual([(rowid, str(VolumeSet.from_bytes(volumes)),
+                           next_volume, has_gaps, max_volume)
+                          for rowid, volumes, next_volume, has_gaps,
+                          max_volume in rows],
+                         [(5, "1-5, 7, 40", 6, 1, 40),
+                          (9, "1-2", 3, 0, 2),
+                          (12, "None", 1, 0, 0),
+                          (20, "None", 1, 0, 0)])
+
+    def testUpgrade(self):
+        data_mgr = self.upgrade()
+        self.assertEqual(data_mgr.user_version(), SERIES_MIGRATIONS[-1][0])
+        self.assertEqual(data_mgr.execute("SELECT rowid, name FROM Series "
+                                          "ORDER BY rowid").fetchall(),
+                         [(5, "Series A"), (9, "series b"),
+                          (12, "Series D"), (20, "Series C")])
+
+        backup = sqlite3.connect(self.database_name + ".v0.bak")
+        self.addCleanup(backup.close)
+        self.assertEqual(backup.execute("PRAGMA user_version").fetchone(),
+                         (0,))
+        self.assertEqual(backup.execute("SELECT volumes_owned FROM Series "
+                                        "WHERE rowid = 5").fetchone(),
+                         ("95,128,0,0",))
+
+    def testCaseCollision(self):
+        con = sqlite3.connect(self.database_name)
+        con.execute("INSERT INTO Series(rowid, name, volumes_owned, "
+                    "is_completed, next_volume, publisher, author, "
+                    "alt_names) VALUES(15, 'SERIES B', '0,0,0,0', 0, 1, "
+                    "'Unknown', 'Unknown', '')")
+        con.commit()
+        con.close()
+
+        with self.assertRaises(MigrationError) as context:
+            self.upgrade()
+        message = str(context.exception)
+        self.assertIn("rowid 9: 'series b'\n  rowid 15: 'SERIES B'", message)
+        self.assertNotIn("Series A", message)
+
+        # Earlier migrations are kept, and the user can rename a series
+        # without the application's SQL functions
+        version = [version for version, description, func
+                   in SERIES_MIGRATIONS
+                   if func is make_names_case_insensitive][0]
+        con = sqlite3.connect(self.database_name)
+        self.assertEqual(con.execute("PRAGMA user_version").fetchone(),
+                         (version - 1,))
+        con.execute("UPDATE Series SET name = 'Series B2' WHERE rowid = 15")
+        con.commit()
+        con.close()
+
+        data_mgr = self.upgrade()
+        self.assertEqual(data_mgr.user_version(), SERIES_MIGRATIONS[-1][0])
+        self.assertEqual(data_mgr.execute("SELECT name FROM Series "
+                                          "WHERE rowid = 15").fetchone(),
+                         ("Series B2",))
+
+    def testDryRun(self):
+        data_mgr = DatabaseManager(self.database_name, None, use_wal=False)
+        self.addCleanup(data_mgr.close)
+        pending = data_mgr.migrate(SERIES_MIGRATIONS, dry_run=True)
+        self.assertEqual(pending, SERIES_MIGRATIONS)
+        self.assertEqual(data_mgr.user_version(), 0)
+        self.assertEqual(data_mgr.execute("PRAGMA journal_mode").fetchone(),
+                         ("delete",))
+        self.assertEqual(data_mgr.execute("SELECT volumes_owned FROM Series "
+                                          "WHERE rowid = 5").fetchone(),
+                         ("95,128,0,0",))
+        self.assertFalse(os.path.exists(self.database_name + ".v0.bak"))
+
+class ConcurrencyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        database_name = os.path.join(self.temp_dir.name, "manga.db")
+        self.writer = DatabaseManager(database_name, init_database, False,
+                                      busy_timeout=0)
+        self.reader = DatabaseManager(database_name, init_database, False,
+                                      busy_timeout=0)
+
+    def tearDown(self):
+        self.writer.close()
+        self.reader.close()
+        self.temp_dir.cleanup()
+
+    def testWalMode(self):
+        self.assertEqual(self.reader.execute("PRAGMA journal_mode")
+                         .fetchone()[0], "wal")
+        # FULL: commits are synced to disk before they return
+        self.assertEqual(self.reader.execute("PRAGMA synchronous")
+                         .fetchone()[0], 2)
+
+    def testReadDuringWrite(self):
+        with self.writer.transaction():
+            self.writer.execute(
+                "INSERT INTO Series(name, volumes_owned, is_completed, "
+                "publisher, author, alt_names) VALUES('Series 1', x'01', 0, "
+                "'Unknown', 'Unknown', 'Unknown')")
+            self.assertEqual(self.reader.execute(
+                "SELECT COUNT(*) FROM Series").fetchone()[0], 0)
+        self.assertEqual(self.reader.execute(
+            "SELECT COUNT(*) FROM Series").fetchone()[0], 1)
+
+    def testBusyRetries(self):
+        old_backoff = databasemanager.BUSY_BACKOFF
+        databasemanager.BUSY_BACKOFF = 0
+        try:
+            with self.writer.transaction():
+                with self.assertRaises(databasemanager.lite.OperationalError):
+                    with self.reader.transaction():
+                        pass
+            self.assertFalse(self.reader.in_transaction())
+            with self.reader.transaction():
+                pass
+        finally:
+            databasemanager.BUSY_BACKOFF = old_backoff
+
+    def testWorkerConnections(self):
+        self.writer.execute(
+            "INSERT INTO Series(name, volumes_owned, is_completed, "
+            "publisher, author, alt_names) VALUES('Series 1', x'07', 0, "
+            "'Unknown', 'Unknown', 'Unknown')")
+        with self.writer.worker() as worker_mgr:
+            self.assertIs(worker_mgr, self.writer)
+
+        def work(_):
+            with self.writer.worker() as worker_mgr:
+                with self.writer.worker() as nested_mgr:
+                    self.assertIs(nested_mgr, worker_mgr)
+                self.assertEqual(worker_mgr.con.execute(
+                    "PRAGMA busy_timeout").fetchone()[0], 0)
+                count = worker_mgr.execute(
+                    "SELECT VOLUME_COUNT(volumes_owned) FROM Series "
+                    "WHERE name REGEXP ?", ("^Series",)).fetchone()[0]
+                return (id(worker_mgr), threading.get_ident(), count)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(work, range(32)))
+        self.assertEqual({count for _, _, count in results}, {3})
+        self.assertLessEqual(len({manager for manager, _, _ in results}),
+                             databasemanager.POOL_SIZE)
+        self.assertGreater(self.writer.pool.idle_count(), 0)
+
+        pool = self.writer.pool
+        pool.idle_timeout = 0
+        pool.prune()
+        self.assertEqual(pool.idle_count(), 0)
+        self.writer.close()
+        self.assertRaises(databasemanager.lite.ProgrammingError,
+                          pool.checkout)
+
+    def testSinglePool(self):
+        barrier = threading.Barrier(8)
+
+        def work(_):
+            barrier.wait()
+            with self.writer.worker():
+                return id(self.writer.pool)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            pools = set(executor.map(work, range(8)))
+        self.assertEqual(pools, {id(self.writer.pool)})
+
+class PaginatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_mgr = DatabaseManager(":memory:", init_database, False)
+        for i in range(23):
+            add_series(self.data_mgr, "Series %02d" % i,
+                       publisher="Publisher",
+                       author="Unknown" if i % 5 == 0
+                       else "Author %d" % (i % 3))
+
+    def tearDown(self):
+        self.data_mgr.close()
+
+    def paginator(self, page_size):
+        return KeysetPaginator(self.data_mgr, "Series",
+                               ("author_unknown", "author", "rowid"),
+                               NOT_EMPTY, page_size=page_size)
+
+    def testPages(self):
+        expected = list(self.paginator(0).fetch_page())
+        self.assertEqual(len(expected), 23)
+        self.assertEqual(expected[-1][6], "Unknown")
+
+        paginator = self.paginator(5)
+        pages = [paginator.fetch_page()]
+        while paginator.next_page():
+            pages.append(paginator.fetch_page())
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+        self.assertEqual(sum(pages, []), expected)
+
+        self.assertTrue(paginator.previous_page())
+        self.assertTrue(paginator.previous_page())
+        self.assertEqual(paginator.fetch_page(), pages[2])
+        self.assertTrue(paginator.next_page())
+        self.assertEqual(paginator.fetch_page(), pages[3])
+
+    def testPrintPages(self):
+        output = io.StringIO()
+        # 'b' is ignored on the first page, and the last page ends the
+        # listing without a prompt
+        with mock.patch("builtins.input",
+                        side_effect=["b", "", "b", "", ""]) as prompt, \
+                redirect_stdout(output):
+            print_pages(self.paginator(10), lambda entry: entry[1])
+        self.assertEqual(prompt.call_count, 5)
+        # pages 1, 2, 1, 2 and 3
+        self.assertEqual(output.getvalue().count("Series "), 43)
+
+    def testPagesSeek(self):
+        paginator = self.paginator(5)
+        paginator.fetch_page()
+        paginator.next_page()
+        sql, params = paginator.page_query()
+
+        plan = [row[-1] for row in self.data_mgr.execute(
+            "EXPLAIN QUERY PLAN " + sql, params)]
+        self.assertEqual(plan, ["SEARCH Series USING INDEX series_author_list"
+                                " ((author_unknown,author)>(?,?))"])
+
+class SearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_mgr = DatabaseManager(":memory:", init_database, False)
+        add_series(self.data_mgr, "Series 1", publisher="Publisher 1",
+                   author="Author 1", alt_names="Alternate Name 1")
+        series = add_series(self.data_mgr, "Series 2",
+                            publisher="Publisher 2", author="Author 1",
+                            alt_names="Alternate Title 2")
+        series.volumes_owned = b"\x0d"
+        series.next_volume = 2
+        series.is_completed = 1
+        series.update_database_entry(self.data_mgr)
+        series = add_series(self.data_mgr, "Last Series",
+                            publisher="Publisher 2", author="Author 2")
+        series.volumes_owned = b""
+        series.next_volume = 1
+        series.update_database_entry(self.data_mgr)
+
+    def tearDown(self):
+        self.data_mgr.close()
+
+    def search(self, term):
+        return [entry[1] for entry in
+                find_series(self.data_mgr, term).fetch_page()]
+
+    def testPhrasePrefix(self):
+        self.assertEqual(self.search("author 1"), ["Series 1", "Series 2"])
+        self.assertEqual(self.search("alternate ti"), ["Series 2"])
+        self.assertEqual(self.search("series"),
+                         ["Last Series", "Series 1", "Series 2"])
+        self.assertEqual(self.search("Publisher 3"), [])
+
+    def testQuerySyntaxIgnored(self):
+        self.assertEqual(self.search('"Author 1"'), ["Series 1", "Series 2"])
+        self.assertEqual(self.search("author OR NEAR(2"), [])
+        self.assertEqual(len(self.search("*")), 3)
+
+    def testIndexFollowsWrites(self):
+        self.data_mgr.execute("UPDATE Series SET author = 'Author 3' "
+                              "WHERE name = 'Series 2'")
+        self.data_mgr.execute("DELETE FROM Series WHERE name = 'Series 1'")
+        self.assertEqual(self.search("author 1"), [])
+        self.assertEqual(self.search("author 3"), ["Series 2"])
+        self.data_mgr.execute("INSERT INTO Series_fts(Series_fts) "
+                              "VALUES('integrity-check')")
+
+    def testStructuredQuery(self):
+        self.assertEqual(self.search("author:1"), ["Series 1", "Series 2"])
+        self.assertEqual(self.search('publisher:"publisher 2" series'),
+                         ["Last Series", "Series 2"])
+        self.assertEqual(self.search("author:1 completed:no"), ["Series 1"])
+        self.assertEqual(self.search("gaps:yes"), ["Series 2"])
+        self.assertEqual(self.search("owns:none"), ["Last Series"])
+        self.assertEqual(self.search("owns:3-4 COMPLETED:Y"), ["Series 2"])
+        self.assertEqual(self.search("owns:2"), [])
+        self.assertEqual(self.search("Re:Zero"), [])
+
+    def testCompactRows(self):
+        for use_fts in (True, False):
+            sql, params = search_query(
+                "series", use_fts,
+                ", ".join("Series." + column for column in COMPACT_COLUMNS))
+            compact = [compact_entry_string(entry) for entry in
+                       self.data_mgr.execute(sql, params).fetchall()]
+            sql, params = search_query("series", use_fts)
+            full = [entry_to_series(entry).compact_string() for entry in
+                    self.data_mgr.execute(sql, params).fetchall()]
+            self.assertEqual(compact, full)
+            self.assertEqual(compact[0], "Last Series by Author 2 "
+                                         "(Next Volume: 1)")
+
+    def testPagedResults(self):
+        for use_fts in (True, False):
+            for term in ("series", "author 1", "gaps:no", "owns:1 series"):
+                table, condition, params, sort_keys = compile_search_source(
+                    term, use_fts)
+                paginator = KeysetPaginator(
+                    self.data_mgr, table, sort_keys, condition, params,
+                    page_size=1, columns="Series.rowid, Series.*")
+                names = [entry[1] for entry in paginator.rows()]
+                self.assertEqual(names, self.search(term), term)
+                self.assertEqual(paginator.count(), len(names), term)
+
+    def testLikeFallback(self):
+        for term in ("author 1", "publisher:2 gaps:no", "owns:1 series"):
+            sql, params = search_query(term, False)
+            self.assertNotIn("Series_fts", sql)
+            self.assertEqual(
+                [entry[1] for entry in self.data_mgr.execute(sql, params)],
+                self.search(term))
+
+    def testInMemoryFilter(self):
+        entries = self.data_mgr.execute("SELECT %s FROM Series ORDER BY name"
+                                        % ", ".join(LIST_COLUMNS)).fetchall()
+        words = [index_words(entry, LIST_COLUMNS) for entry in entries]
+        for term in ("author 1", "alternate ti", "series", "Publisher 3",
+                     '"Author 1"', "author OR NEAR(2", "*", "author:1",
+                     'publisher:"publisher 2" series', "author:1 completed:no",
+                     "gaps:yes", "owns:none", "owns:any", "owns:3-4 COMPLETED:Y",
+                     "owns:2", "Re:Zero", "SÉRIES 2", ""):
+            matches = compile_filter(term, LIST_COLUMNS)
+            self.assertEqual(
+                [entry[1] for entry in entries if matches(entry)],
+                sorted(self.search(term)), term)
+            self.assertEqual(
+                [entry[1] for entry, entry_words in zip(entries, words)
+                 if matches(entry, entry_words)],
+                sorted(self.search(term)), term)
+
+    def testListRowSeries(self):
+        fields = ("rowid", "name", "volumes_owned", "is_completed",
+                  "next_volume", "publisher", "author", "alt_names",
+                  "volumes_owned_readable")
+        list_entries = self.data_mgr.execute(
+            "SELECT %s FROM Series ORDER BY rowid"
+            % ", ".join(LIST_COLUMNS)).fetchall()
+        entries = self.data_mgr.execute(
+            "SELECT rowid, * FROM Series ORDER BY rowid").fetchall()
+        for list_entry, entry in zip(list_entries, entries):
+            self.assertEqual(
+                [getattr(list_entry_to_series(list_entry), field)
+                 for field in fields],
+                [getattr(entry_to_series(entry), field) for field in fields])
+
+    def testSyntaxErrors(self):
+        for term in ("completed:maybe", "owns:0", "owns:5-3", "owns:x",
+                     "author:-"):
+            self.assertRaises(SearchSyntaxError, compile_search_source, term)
+            self.assertRaises(SearchSyntaxError, compile_filter, term,
+                              LIST_COLUMNS)
+
+class RegexpCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_mgr = DatabaseManager(":memory:", init_database, False)
+        self.data_mgr.executemany(
+            "INSERT INTO Series(name, volumes_owned, is_completed) "
+            "VALUES(?, x'01', 0)",
+            [("Series %d" % i,) for i in range(10)])
+        databasemanager.compile_pattern.cache_clear()
+
+    def tearDown(self):
+        self.data_mgr.close()
+
+    def count_matches(self, pattern):
+        return self.data_mgr.execute(
+            "SELECT COUNT(*) FROM Series WHERE name REGEXP ?",
+            (pattern,)).fetchone()[0]
+
+    def testPatternCompiledOnce(self):
+        self.assertEqual(self.count_matches("[0-4]$"), 5)
+        info = databasemanager.regexp_cache_info()
+        self.assertEqual((info.misses, info.hits, info.currsize), (1, 9, 1))
+
+        self.assertEqual(self.count_matches("[0-4]$"), 5)
+        self.assertEqual(self.count_matches("^Series"), 10)
+        info = databasemanager.regexp_cache_info()
+        self.assertEqual((info.misses, info.hits, info.currsize), (2, 28, 2))
+        self.assertEqual(info.maxsize, databasemanager.REGEXP_CACHE_SIZE)
+
+if __name__ == "__main__":
+    unittest.main()
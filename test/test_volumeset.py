@@ -0,0 +1,61 @@
+""" test_volumeset.py
+Test file for volumeset.py
+
+Copyright 2020 by Nicholas Bishop
+"""
+
+import unittest
+import io
+import os
+import sys
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "src"))
+
+from volumeset import VolumeSet
+
+class VolumeSetTest(unittest.TestCase):
+
+    def parse(self, vol_list, volume_limit=128):
+        with redirect_stdout(io.StringIO()):
+            return VolumeSet.parse(vol_list, volume_limit)
+
+    def testNextVolume(self):
+        self.assertEqual(VolumeSet().next_volume(), 1)
+        self.assertEqual(self.parse("1-3").next_volume(), 4)
+        self.assertEqual(self.parse("1-3, 5").next_volume(), 4)
+        self.assertEqual(self.parse("2-4").next_volume(), 1)
+        self.assertEqual(VolumeSet.from_range(1, 200).next_volume(), 201)
+
+    def testRanges(self):
+        self.assertEqual(list(VolumeSet().ranges()), [])
+        self.assertEqual(list(self.parse("1-3, 5, 7-9, 64").ranges()),
+                         [(1, 3), (5, 5), (7, 9), (64, 64)])
+        self.assertEqual(str(self.parse("9, 1, 2, 3")), "1-3, 9")
+        self.assertEqual(str(VolumeSet()), "None")
+
+    def testHasGaps(self):
+        self.assertFalse(VolumeSet().has_gaps())
+        self.assertFalse(self.parse("1-10").has_gaps())
+        self.assertTrue(self.parse("1-3, 5").has_gaps())
+        self.assertTrue(self.parse("2").has_gaps())
+
+    def testParseClamping(self):
+        self.assertEqual(self.parse("5-200", 10), VolumeSet.from_range(5, 10))
+        self.assertEqual(self.parse("11, 10", 10), self.parse("10", 10))
+        self.assertEqual(self.parse("0, x, 0-3, 2"), self.parse("2"))
+        self.assertEqual(self.parse("None"), VolumeSet())
+
+    def testLargeVolumes(self):
+        volumes = self.parse("1, 129, 300-301", 512)
+        self.assertEqual(volumes.max_volume(), 301)
+        self.assertEqual(volumes.count(), 4)
+        self.assertIn(129, volumes)
+        self.assertNotIn(128, volumes)
+        self.assertEqual(str(volumes), "1, 129, 300-301")
+        self.assertEqual(VolumeSet.from_bytes(volumes.to_bytes()), volumes)
+        self.assertEqual(VolumeSet().to_bytes(), b"")
+
+if __name__ == "__main__":
+    unittest.main()